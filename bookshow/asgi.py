@@ -0,0 +1,7 @@
+from flaskshow import async_api, create_app
+
+app = async_api.init_app(create_app())
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app', port=8001)
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""Compare the WSGI and ASGI servers on the read-only API under many pollers.
+
+Opens --clients keep-alive connections to each server. Every client
+polls the show listing of one venue, or one show, sending back the ETag
+it last saw as a real poller would. Reports throughput, latency
+percentiles, 304s and errors for each server.
+
+By default both servers are started on a fresh synthetic dataset:
+gunicorn with threaded workers for run:app, uvicorn for asgi:app. Give
+--wsgi-url and --asgi-url to measure servers you started yourself,
+seeded with benchmarks.dataset at the same --tickets.
+
+    python -m benchmarks.asgi --clients 100,1000 --duration 15 --workers 2
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+from benchmarks import dataset
+from benchmarks.loadtest import percentile
+
+
+class Connection:
+    """One HTTP/1.1 keep-alive connection, reopened if the server closes it."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def get(self, path, etag=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        request = 'GET %s HTTP/1.1\r\nHost: %s\r\n' % (path, self.host)
+        if etag:
+            request += 'If-None-Match: %s\r\n' % etag
+        self.writer.write((request + '\r\n').encode('latin-1'))
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.lower()] = value.strip()
+        await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, headers.get('etag')
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def poller(url, paths, deadline, records):
+    parts = urllib.parse.urlsplit(url)
+    connection = Connection(parts.hostname, parts.port)
+    etags = {}
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            status, etag = await connection.get(path, etags.get(path))
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            connection.close()
+            records.append((None, time.perf_counter() - t0))
+            await asyncio.sleep(0.1)
+            continue
+        etags[path] = etag or etags.get(path)
+        records.append((status, time.perf_counter() - t0))
+    connection.close()
+
+
+async def measure(url, clients, duration, shape, seed):
+    venues, events, _ = shape
+    deadline = time.perf_counter() + duration
+    records = []
+    pollers = []
+    for i in range(clients):
+        # a few paths per client, so most polls are conditional
+        paths = ['/api/shows?limit=20&venue_id=%d' % (1 + (seed + i) % venues),
+                 '/api/shows/%d' % (1 + (seed * 7 + i) % events)]
+        pollers.append(poller(url, paths, deadline, records))
+    t0 = time.perf_counter()
+    await asyncio.gather(*pollers)
+    elapsed = time.perf_counter() - t0
+    latencies = sorted(latency for status, latency in records if status is not None)
+    return {
+        'requests': len(latencies), 'rps': len(latencies) / elapsed,
+        'not_modified': sum(1 for status, _ in records if status == 304),
+        'errors': sum(1 for status, _ in records if status is None or status >= 500),
+        'p50': percentile(latencies, 0.50) * 1000 if latencies else 0,
+        'p95': percentile(latencies, 0.95) * 1000 if latencies else 0,
+        'p99': percentile(latencies, 0.99) * 1000 if latencies else 0,
+    }
+
+
+def _wait_for(url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('server exited with %d' % process.returncode)
+        try:
+            urllib.request.urlopen(url + '/api/venues?limit=1', timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server at %s did not start' % url)
+
+
+def spawn(args, env):
+    """Start gunicorn (WSGI) and uvicorn (ASGI); returns their URLs and processes."""
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    wsgi = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '-k', 'gthread', '--threads', str(args.threads),
+         '--keep-alive', '30', '-b', '127.0.0.1:%d' % args.port, '--log-level', 'warning', 'run:app'],
+        cwd=cwd, env=env)
+    asgi = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', '--workers', str(args.workers), '--port', str(args.port + 1),
+         '--log-level', 'warning', '--no-access-log', '--timeout-keep-alive', '30', 'asgi:app'],
+        cwd=cwd, env=env)
+    urls = ('http://127.0.0.1:%d' % args.port, 'http://127.0.0.1:%d' % (args.port + 1))
+    try:
+        for url, process in zip(urls, (wsgi, asgi)):
+            _wait_for(url, process)
+    except Exception:
+        wsgi.terminate()
+        asgi.terminate()
+        raise
+    return urls, (wsgi, asgi)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', default='100,1000', help='comma-separated concurrent pollers')
+    parser.add_argument('--duration', type=float, default=15, help='seconds per run')
+    parser.add_argument('--tickets', type=dataset.parse_scale, default='10k')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=2, help='processes per spawned server')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--port', type=int, default=8700, help='WSGI port when spawning; ASGI uses the next')
+    parser.add_argument('--wsgi-url')
+    parser.add_argument('--asgi-url')
+    args = parser.parse_args(argv)
+
+    processes = ()
+    if args.wsgi_url and args.asgi_url:
+        urls = (args.wsgi_url, args.asgi_url)
+    else:
+        env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'),
+                   METRICS_ENABLED='0', RATE_LIMIT_ENABLED='0')
+        os.environ.update(env)
+        from flaskshow import create_app, db
+        app = create_app()
+        print('Generating %d tickets...' % args.tickets, flush=True)
+        with app.app_context():
+            db.create_all()
+            dataset.generate(db, args.tickets, args.seed)
+        urls, processes = spawn(args, env)
+
+    try:
+        shape = dataset.shape(args.tickets)
+        print('%-6s %8s %9s %8s %8s %9s %9s %9s' % (
+            'server', 'clients', 'requests', 'req/s', '304s', 'p50 ms', 'p95 ms', 'p99 ms') + '   errors')
+        for clients in (int(n) for n in args.clients.split(',')):
+            for name, url in zip(('wsgi', 'asgi'), urls):
+                row = asyncio.run(measure(url, clients, args.duration, shape, args.seed))
+                print('%-6s %8d %9d %8.1f %8d %9.2f %9.2f %9.2f %8d' % (
+                    name, clients, row['requests'], row['rps'], row['not_modified'],
+                    row['p50'], row['p95'], row['p99'], row['errors']), flush=True)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Bulk import benchmark.
+
+Generates venues, events and ticket allocations as CSV/NDJSON, runs them
+through the bulk importer and reports rows/s for each kind. A few rows in
+every file are deliberately invalid and must come back as row errors.
+
+    python -m benchmarks.bulk_import --rows 100000
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def venues_csv(n):
+    lines = ['name,address,capacity']
+    for i in range(n):
+        lines.append('Venue %d,%d Import Street,%s' % (i, i, 'lots' if i % 10000 == 9999 else 500))
+    return '\n'.join(lines) + '\n'
+
+
+def events_ndjson(n, venues):
+    start = datetime(2030, 1, 1)
+    lines = []
+    for i in range(n):
+        lines.append(json.dumps({
+            'name': 'Show %d' % i,
+            'start_time': (start + timedelta(hours=i)).isoformat(sep=' ', timespec='minutes'),
+            'end_time': (start + timedelta(hours=i + 2)).isoformat(sep=' ', timespec='minutes'),
+            'venue_id': i % venues + 1 if i % 10000 != 9999 else 0,
+            'ticket_price': 25,
+        }))
+    lines.append('{not json')
+    return '\n'.join(lines) + '\n'
+
+
+def tickets_csv(n, events):
+    lines = ['event_id,quantity,buyer_id']
+    for i in range(n):
+        lines.append('%d,%d,' % (i % events + 1, 2))
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    from flaskshow import bulk, create_app, db
+    app = create_app()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        venues = max(args.rows // 10, 1)
+        runs = (
+            ('venues', 'csv', venues_csv(args.rows)),
+            ('events', 'ndjson', events_ndjson(args.rows, venues)),
+            ('tickets', 'csv', tickets_csv(args.rows, args.rows)),
+        )
+        for kind, fmt, body in runs:
+            t0 = time.perf_counter()
+            result = bulk.import_rows(kind, bulk.read_rows(io.StringIO(body, newline=''), fmt))
+            elapsed = time.perf_counter() - t0
+            print('%-8s %7d inserted %5d rejected in %6.2fs  (%.0f rows/s)' % (
+                kind, result.inserted, result.failed, elapsed, (result.inserted + result.failed) / elapsed))
+            for error in result.errors[:3]:
+                print('    line %s: %s' % (error['line'], json.dumps(error['errors'])))
+        db.session.remove()
+        db.drop_all()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
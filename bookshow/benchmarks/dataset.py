@@ -0,0 +1,185 @@
+"""Deterministic synthetic dataset for benchmarks.
+
+Fills an empty database, never the app's own, with venues, events, buyers and tickets in
+proportion to a ticket count. The same --tickets and --seed always give
+the same rows and ids, so runs on different commits are comparable.
+
+    python -m benchmarks.dataset --tickets 1m --database-url sqlite:////tmp/bench.db
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000, '10m': 10000000}
+BATCH_SIZE = 10000
+BUYER_PASSWORD = 'benchmark'
+START = datetime(2030, 1, 1)
+
+WORDS = ('Grand', 'Royal', 'Blue', 'Golden', 'River', 'Park', 'Harbour', 'Crystal', 'Garden',
+         'Union', 'Empire', 'Lyric', 'Apollo', 'Victoria', 'Phoenix', 'Orchid', 'Summit', 'Regent')
+PLACES = ('Hall', 'Theatre', 'Arena', 'Stadium', 'Club', 'Pavilion', 'Opera House', 'Auditorium')
+GENRES = ('Jazz', 'Opera', 'Comedy', 'Ballet', 'Rock', 'Symphony', 'Musical', 'Drama', 'Folk',
+          'Magic', 'Circus', 'Poetry')
+STREETS = ('High Street', 'Station Road', 'Church Lane', 'Market Square', 'Mill Road', 'King Street')
+
+
+def parse_scale(value):
+    """'100k', '1m' or a plain number of tickets."""
+    return SCALES[value.lower()] if value.lower() in SCALES else int(value)
+
+
+def shape(tickets):
+    """(venues, events, buyers) for a dataset of the given number of tickets."""
+    events = max(tickets // 100, 10)
+    return max(events // 20, 5), events, max(tickets // 10, 10)
+
+
+def search_terms():
+    return WORDS + GENRES
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _venues(rng, count):
+    for i in range(1, count + 1):
+        yield {'id': i, 'name': '%s %s %d' % (rng.choice(WORDS), rng.choice(PLACES), i),
+               'address': '%d %s' % (rng.randint(1, 400), rng.choice(STREETS)),
+               'capacity': rng.choice((500, 1000, 2000, 5000, 20000))}
+
+
+def _events(rng, count, venues):
+    for i in range(1, count + 1):
+        # spread over about a year, a few shows per venue per day at most
+        start = START + timedelta(minutes=30 * rng.randrange(365 * 24 * 2))
+        yield {'id': i, 'name': '%s %s %d' % (rng.choice(WORDS), rng.choice(GENRES), i),
+               'start_time': start, 'end_time': start + timedelta(hours=rng.choice((1, 2, 3))),
+               'venue_id': rng.randint(1, venues), 'ticket_price': float(rng.choice((10, 15, 25, 40, 60, 90)))}
+
+
+def _buyers(count, hashed):
+    for i in range(1, count + 1):
+        yield {'id': i, 'name': 'Buyer %d' % i, 'email': buyer_email(i),
+               'password': hashed, 'phone': '07%09d' % i}
+
+
+def _tickets(rng, count, events, buyers, prices, capacities):
+    sold = [0] * (events + 1)
+    for i in range(1, count + 1):
+        quantity = rng.choice((1, 1, 1, 2, 2, 4))
+        event_id = rng.randint(1, events)
+        # move on to the next event with room; the dataset never oversells
+        for _ in range(events):
+            if sold[event_id] + quantity <= capacities[event_id]:
+                break
+            event_id = event_id % events + 1
+        else:
+            return
+        sold[event_id] += quantity
+        yield {'id': i, 'event_id': event_id, 'buyer_id': rng.randint(1, buyers),
+               'quantity': quantity, 'price': prices[event_id]}
+
+
+def buyer_email(i):
+    return 'buyer%d@example.com' % i
+
+
+def generate(db, tickets, seed=1, rounds=4, progress=None):
+    """Populate an empty database; returns {table: rows} of what was written.
+
+    Every buyer shares one bcrypt hash of BUYER_PASSWORD at the given cost,
+    since hashing millions of passwords would take longer than the run.
+    """
+    from sqlalchemy import insert, select
+    from flaskshow import inventory, passwords, sales, search
+    from flaskshow.models import Buyer, Event, Ticket, Venue
+    from flaskshow.versioning import bump
+
+    rng = random.Random(seed)
+    venues, events, buyers = shape(tickets)
+    counts = {}
+
+    def load(model, rows):
+        written = 0
+        for batch in _batches(rows):
+            db.session.execute(insert(model), batch)
+            db.session.commit()
+            written += len(batch)
+            if progress:
+                progress(model.__tablename__, written)
+        counts[model.__tablename__] = written
+        return written
+
+    venue_rows = list(_venues(rng, venues))
+    capacities = [0] + [row['capacity'] for row in venue_rows]
+    load(Venue, venue_rows)
+    event_capacity, prices = [0], [0.0]
+
+    def events_with_capacity():
+        for row in _events(rng, events, venues):
+            event_capacity.append(capacities[row['venue_id']])
+            prices.append(row['ticket_price'])
+            yield row
+
+    load(Event, events_with_capacity())
+    load(Buyer, _buyers(buyers, passwords._hash(BUYER_PASSWORD, rounds)))
+    load(Ticket, _tickets(rng, tickets, events, buyers, prices, event_capacity))
+
+    # what the write paths would have maintained row by row
+    search.rebuild()
+    inventory.ensure_inventories(select(Event.id))
+    sales.rebuild()
+    bump(db.session.connection(), 'venue', 'event')
+    db.session.commit()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickets', type=parse_scale, default='10k',
+                        help='%s or a number' % ', '.join(SCALES))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=4, help='bcrypt cost of the shared buyer password')
+    parser.add_argument('--database-url', required=True, help='a scratch database to fill')
+    parser.add_argument('--force', action='store_true', help='drop every table the database already has')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from sqlalchemy import inspect
+    from flaskshow import create_app, db
+    app = create_app()
+    with app.app_context():
+        tables = inspect(db.engine).get_table_names()
+    if tables and not args.force:
+        print('%s already has tables (%s); give --force to drop them.' % (args.database_url, ', '.join(tables)))
+        return 1
+
+    def progress(table, written):
+        if written % (BATCH_SIZE * 10) == 0:
+            print('  %s: %d' % (table, written), flush=True)
+
+    t0 = time.perf_counter()
+    with app.app_context():
+        if tables:
+            db.drop_all()
+        db.create_all()
+        counts = generate(db, args.tickets, args.seed, args.rounds, progress)
+    print('Generated %s in %.1fs (seed %d, buyer password %r).' % (
+        ', '.join('%d %s' % (n, table) for table, n in counts.items()),
+        time.perf_counter() - t0, args.seed, BUYER_PASSWORD))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Streaming export benchmark.
+
+Seeds tickets at two table sizes and streams /api/export/tickets in both
+formats, reporting time to first byte, total time and peak Python memory
+while the body is produced. Exits non-zero if peak memory grows with the
+table size, which would mean rows are being collected instead of streamed.
+Timings come from an untraced pass; tracemalloc slows Python down severalfold.
+
+    python -m benchmarks.export --sizes 10000,100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# allowed growth in peak memory between the smallest and largest size
+MEMORY_SLACK = 2.0
+
+
+def seed(db, models, tickets):
+    Admin, Event, Ticket, Venue = models
+    db.session.add(Admin(username='admin', email='admin@example.com', password='x'))
+    db.session.add(Venue(name='Venue', address='Street', capacity=tickets))
+    start = datetime(2030, 1, 1)
+    db.session.execute(db.insert(Event), [
+        {'name': 'Show %d' % i, 'start_time': start + timedelta(hours=i),
+         'end_time': start + timedelta(hours=i + 2), 'venue_id': 1, 'ticket_price': 10.0}
+        for i in range(100)])
+    for offset in range(0, tickets, 10000):
+        db.session.execute(db.insert(Ticket), [
+            {'event_id': i % 100 + 1, 'quantity': 2, 'price': 10.0, 'buyer_id': None}
+            for i in range(offset, min(offset + 10000, tickets))])
+    db.session.commit()
+
+
+def stream(client, url, trace=False):
+    """Return (seconds to first chunk, total seconds, bytes, peak traced bytes or None)."""
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    response = client.get(url, buffered=False)
+    assert response.status_code == 200, (url, response.status_code)
+    first, size = None, 0
+    for chunk in response.response:
+        if first is None:
+            first = time.perf_counter() - t0
+        size += len(chunk)
+    response.close()
+    total = time.perf_counter() - t0
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return first, total, size, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000')
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    from flaskshow import create_app, db
+    from flaskshow.models import Admin, Event, Ticket, Venue
+    app = create_app()
+
+    peaks = {}
+    for size in sizes:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            seed(db, (Admin, Event, Ticket, Venue), size)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = 'admin:1'
+        for fmt in ('ndjson', 'csv'):
+            url = '/api/export/tickets?format=%s' % fmt
+            first, total, written, _ = stream(client, url)
+            peak = stream(client, url, trace=True)[3]
+            peaks.setdefault(fmt, []).append(peak)
+            print('%8d tickets  %-6s first byte %6.1fms  total %6.2fs  %7.1f MB  (%.0f rows/s)  peak %5.1f MB' % (
+                size, fmt, first * 1000, total, written / 1e6, size / total, peak / 1e6))
+
+    failed = False
+    for fmt, values in peaks.items():
+        if values[-1] > values[0] * MEMORY_SLACK:
+            print('%s: peak memory grew from %.1f MB to %.1f MB' % (fmt, values[0] / 1e6, values[-1] / 1e6))
+            failed = True
+    print('memory grows with table size' if failed else 'memory flat across sizes')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""Flash-sale benchmark for the seat inventory.
+
+Fires N concurrent purchases at a single event and checks that the number
+of seats sold never exceeds the venue capacity.
+
+    python -m benchmarks.inventory --attempts 2000 --capacity 500 --workers 32
+    python -m pytest benchmarks/inventory.py
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--attempts', type=int, default=2000)
+    parser.add_argument('--capacity', type=int, default=500)
+    parser.add_argument('--quantity', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--database-url', help='a scratch database; defaults to a throwaway SQLite file')
+    parser.add_argument('--force', action='store_true', help='drop every table the database already has')
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmpdir = tempfile.mkdtemp()
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+
+    from sqlalchemy import inspect
+    from flaskshow import create_app, db, inventory
+    from flaskshow.models import Event, Ticket, Venue
+    app = create_app()
+
+    with app.app_context():
+        tables = inspect(db.engine).get_table_names()
+    if tables and not args.force:
+        print('%s already has tables (%s); give --force to drop them.' % (args.database_url, ', '.join(tables)))
+        return 1
+
+    with app.app_context():
+        if tables:
+            db.drop_all()
+        db.create_all()
+        venue = Venue(name='Bench Arena', address='Nowhere', capacity=args.capacity)
+        db.session.add(venue)
+        db.session.flush()
+        start = datetime.now() + timedelta(days=1)
+        event = Event(name='Flash Sale', start_time=start, end_time=start + timedelta(hours=2),
+                      venue_id=venue.id, ticket_price=10.0)
+        db.session.add(event)
+        db.session.commit()
+        event_id = event.id
+
+    def attempt(i):
+        with app.app_context():
+            event = db.session.get(Event, event_id)
+            t0 = time.perf_counter()
+            try:
+                inventory.purchase(event, None, args.quantity)
+                ok = True
+            except inventory.SoldOut:
+                ok = False
+            return ok, time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.workers) as pool:
+        results = list(pool.map(attempt, range(args.attempts)))
+    elapsed = time.perf_counter() - t0
+
+    with app.app_context():
+        sold = db.session.query(db.func.coalesce(db.func.sum(Ticket.quantity), 0)).scalar()
+        remaining = inventory.seats_remaining(event_id)
+
+    latencies = sorted(latency for _, latency in results)
+    succeeded = sum(1 for ok, _ in results if ok)
+    print('attempts      %d (%d workers)' % (args.attempts, args.workers))
+    print('succeeded     %d' % succeeded)
+    print('sold / cap    %d / %d (remaining %d)' % (sold, args.capacity, remaining))
+    print('throughput    %.0f purchases/s' % (args.attempts / elapsed))
+    print('latency p50   %.2f ms' % (latencies[len(latencies) // 2] * 1000))
+    print('latency p99   %.2f ms' % (latencies[int(len(latencies) * 0.99) - 1] * 1000))
+
+    if sold > args.capacity or sold != succeeded * args.quantity:
+        print('OVERSOLD' if sold > args.capacity else 'COUNTER MISMATCH')
+        return 1
+    return 0
+
+
+def test_moving_a_show_resizes_its_counter():
+    # collected when pytest is given this file: `pytest benchmarks/inventory.py`
+    from flaskshow import create_app, db, inventory
+    from flaskshow.models import Admin, Event, SeatInventory, Venue
+    tmpdir = tempfile.mkdtemp()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmpdir, 'bench.db'),
+                      'RATE_LIMIT_PATH': os.path.join(tmpdir, 'ratelimit.db')})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Admin(username='admin', email='admin@example.com', password='x'))
+        db.session.add_all([Venue(name='Big Hall', address='1 Street', capacity=100),
+                            Venue(name='Small Room', address='2 Street', capacity=2),
+                            Venue(name='Tiny Room', address='3 Street', capacity=1)])
+        db.session.add(Event(name='Moving Show', start_time=datetime(2030, 1, 1, 20), end_time=datetime(2030, 1, 1, 22),
+                             venue_id=1, ticket_price=10.0))
+        db.session.commit()
+        inventory.purchase(db.session.get(Event, 1), None, 1)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = 'admin:1'
+    page = client.get('/admin/edit_show/1').get_data(as_text=True)
+    token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page).group(1)
+
+    def move(path, venue_id):
+        return client.open(path, method='POST' if path.startswith('/admin') else 'PUT', data={
+            'csrf_token': token, 'name': 'Moving Show', 'venue': str(venue_id), 'ticket_price': '10',
+            'start_time': '2030-01-01 20:00', 'end_time': '2030-01-01 22:00'})
+
+    assert move('/admin/edit_show/1', 2).status_code == 302
+    with app.app_context():
+        counter = db.session.get(SeatInventory, 1)
+        assert (counter.capacity, counter.remaining) == (2, 1)
+        inventory.purchase(db.session.get(Event, 1), None, 1)
+        try:
+            inventory.purchase(db.session.get(Event, 1), None, 1)
+        except inventory.SoldOut:
+            pass
+        else:
+            raise AssertionError('sold a third seat in a two-seat venue')
+
+    # two seats are sold, so the one-seat room is refused on both paths
+    assert 'that venue holds' in move('/admin/edit_show/1', 3).get_data(as_text=True)
+    response = move('/api/shows/1', 3)
+    assert response.status_code == 400, response.get_json()
+    assert move('/api/shows/1', 1).status_code == 200
+    with app.app_context():
+        counter = db.session.get(SeatInventory, 1)
+        assert (db.session.get(Event, 1).venue_id, counter.capacity, counter.remaining) == (1, 100, 98)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
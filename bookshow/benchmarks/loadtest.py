@@ -0,0 +1,310 @@
+"""Mixed-workload load driver.
+
+Parallel clients run a weighted mix of browsing, search, logins, ticket
+purchases and API reads, either in-process through the Flask test client
+or against a running server. Reports throughput, p50/p95/p99 latency and
+SQL statements per route (from the app's /metrics), and stores the
+results as JSON so commits can be compared.
+
+    python -m benchmarks.loadtest --tickets 100k --clients 16 --duration 30
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --tickets 1m
+    python -m benchmarks.loadtest --compare results/old.json results/new.json
+
+Against a server, seed it first with benchmarks.dataset at the same
+--tickets and --seed, and run it with BCRYPT_LOG_ROUNDS equal to the
+dataset's --rounds so logins don't re-hash passwords, and with
+RATE_LIMIT_ENABLED=0: every client comes from one address.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks import dataset
+
+MIX = {'home': 25, 'shows_list': 10, 'search': 20, 'api_shows': 15, 'api_show': 10, 'login': 5, 'buy': 15}
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+_CSRF = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+_METRIC = re.compile(r'^flaskshow_db_statements_per_request_(sum|count)\{endpoint="([^"]+)"\} (\S+)$')
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_data()
+
+    def post(self, path, data):
+        response = self.client.post(path, data=data)
+        return response.status_code, response.get_data()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # time each request on its own, as the in-process client does
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data):
+        return self._open(urllib.request.Request(self.base_url + path,
+                                                 data=urllib.parse.urlencode(data).encode()))
+
+
+class VirtualUser:
+    """One client session running operations from the mix."""
+
+    def __init__(self, client, rng, shape, records):
+        self.client = client
+        self.rng = rng
+        self.venues, self.events, self.buyers = shape
+        self.records = records
+        self.buyer = rng.randint(1, self.buyers)
+        self.signed_in = False
+
+    def request(self, label, method, path, data=None, expect=(200,)):
+        t0 = time.perf_counter()
+        if method == 'GET':
+            status, body = self.client.get(path)
+        else:
+            status, body = self.client.post(path, data)
+        self.records.append((label, status in expect, time.perf_counter() - t0))
+        return status, body
+
+    def _form_token(self, label, path):
+        status, body = self.request(label, 'GET', path)
+        match = _CSRF.search(body.decode('utf-8', 'replace')) if status == 200 else None
+        return match.group(1) if match else None
+
+    def home(self):
+        self.request('main.home', 'GET', '/')
+
+    def shows_list(self):
+        self.request('main.shows_list', 'GET', '/shows_list')
+
+    def search(self):
+        term = self.rng.choice(dataset.search_terms())
+        self.request('main.search_results', 'GET', '/search?query=' + urllib.parse.quote(term))
+
+    def api_shows(self):
+        self.request('api.get_shows', 'GET', '/api/shows?limit=20&venue_id=%d' % self.rng.randint(1, self.venues))
+
+    def api_show(self):
+        self.request('api.get_show', 'GET', '/api/shows/%d' % self.rng.randint(1, self.events))
+
+    def login(self):
+        if self.signed_in:
+            # the login page redirects a signed-in buyer away
+            self.request('buyer.logout_us', 'GET', '/logout/user', expect=(302,))
+        token = self._form_token('buyer.user_login GET', '/user/login')
+        status, _ = self.request('buyer.user_login POST', 'POST', '/user/login', expect=(302,), data={
+            'csrf_token': token or '', 'email': dataset.buyer_email(self.buyer),
+            'password': dataset.BUYER_PASSWORD})
+        self.signed_in = status == 302
+
+    def buy(self):
+        if not self.signed_in:
+            self.login()
+        path = '/buy_ticket/%d' % self.rng.randint(1, self.events)
+        token = self._form_token('buyer.buy_ticket GET', path + '?quantity=1')
+        # 302 is a sale, 200 re-renders the form with "sold out"
+        self.request('buyer.buy_ticket POST', 'POST', path, expect=(200, 302),
+                     data={'csrf_token': token or '', 'quantity': '1'})
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def statements_per_request(client):
+    """{endpoint: (sum, count)} of SQL statements, or {} if /metrics is off."""
+    status, body = client.get('/metrics')
+    if status != 200:
+        return {}
+    totals = {}
+    for line in body.decode().splitlines():
+        match = _METRIC.match(line)
+        if match:
+            kind, endpoint, value = match.groups()
+            totals.setdefault(endpoint, [0.0, 0.0])[kind == 'count'] = float(value)
+    return totals
+
+
+def summarize(records, elapsed, before, after):
+    routes = {}
+    for label, ok, latency in records:
+        routes.setdefault(label, ([], []))[0 if ok else 1].append(latency)
+    summary = {}
+    for label, (ok, failed) in sorted(routes.items()):
+        latencies = sorted(ok + failed)
+        endpoint = label.split()[0]
+        queries = None
+        if endpoint in after:
+            total = after[endpoint][0] - before.get(endpoint, (0, 0))[0]
+            count = after[endpoint][1] - before.get(endpoint, (0, 0))[1]
+            queries = round(total / count, 2) if count else None
+        summary[label] = {
+            'requests': len(latencies), 'errors': len(failed), 'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'statements': queries,
+        }
+    return summary
+
+
+def print_summary(routes, elapsed):
+    print('%-24s %8s %7s %8s %9s %9s %9s %6s' % ('route', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'sql'))
+    for label, row in routes.items():
+        print('%-24s %8d %7d %8.1f %9.2f %9.2f %9.2f %6s' % (
+            label, row['requests'], row['errors'], row['rps'], row['p50_ms'], row['p95_ms'], row['p99_ms'],
+            '-' if row['statements'] is None else '%.1f' % row['statements']))
+    total = sum(row['requests'] for row in routes.values())
+    print('%d requests in %.1fs, %.1f req/s' % (total, elapsed, total / elapsed))
+
+
+def compare(old, new):
+    """Print p95 and throughput changes per route between two result files."""
+    print('%-24s %10s %10s %8s %10s %10s %8s' % ('route', 'old p95', 'new p95', 'change', 'old req/s', 'new req/s', 'change'))
+    for label in sorted(set(old['routes']) | set(new['routes'])):
+        a, b = old['routes'].get(label), new['routes'].get(label)
+        if not a or not b:
+            print('%-24s %s' % (label, 'only in new' if b else 'only in old'))
+            continue
+        print('%-24s %10.2f %10.2f %+7.0f%% %10.1f %10.1f %+7.0f%%' % (
+            label, a['p95_ms'], b['p95_ms'], (b['p95_ms'] / a['p95_ms'] - 1) * 100 if a['p95_ms'] else 0,
+            a['rps'], b['rps'], (b['rps'] / a['rps'] - 1) * 100 if a['rps'] else 0))
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(value):
+    mix = dict(MIX)
+    for item in filter(None, value.split(',')):
+        name, _, weight = item.partition('=')
+        if name not in MIX:
+            raise argparse.ArgumentTypeError('unknown operation %r; choose from %s' % (name, ', '.join(MIX)))
+        mix[name] = int(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='run against this server instead of in-process')
+    parser.add_argument('--tickets', type=dataset.parse_scale, default='10k',
+                        help='dataset size to generate, or that the server was seeded with')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=4, help='bcrypt cost of the dataset passwords')
+    parser.add_argument('--database-url', help='in-process: use this database as already seeded')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20, help='seconds')
+    parser.add_argument('--mix', type=parse_mix, default=MIX, help='e.g. buy=30,login=0')
+    parser.add_argument('--output', help='result file; defaults to results/<commit>-<time>.json')
+    parser.add_argument('--baseline', help='result file to compare this run against')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='only compare two result files')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as a, open(args.compare[1]) as b:
+            compare(json.load(a), json.load(b))
+        return 0
+
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        if args.database_url:
+            os.environ['DATABASE_URL'] = args.database_url
+        else:
+            os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+        from flaskshow import create_app, db
+        app = create_app()
+        app.config['BCRYPT_LOG_ROUNDS'] = args.rounds
+        app.config['RATE_LIMIT_ENABLED'] = False  # every virtual user shares one address
+        if not args.database_url:
+            print('Generating %d tickets...' % args.tickets, flush=True)
+            with app.app_context():
+                db.create_all()
+                dataset.generate(db, args.tickets, args.seed, args.rounds)
+        make_client = lambda: InProcessClient(app)
+
+    shape = dataset.shape(args.tickets)
+    operations, weights = zip(*[(name, weight) for name, weight in args.mix.items() if weight > 0])
+    deadline = None
+    records = []
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random('%d-%d' % (args.seed, index))
+        mine = []
+        user = VirtualUser(make_client(), rng, shape, mine)
+        while time.perf_counter() < deadline:
+            getattr(user, rng.choices(operations, weights)[0])()
+        with lock:
+            records.extend(mine)
+
+    before = statements_per_request(make_client())
+    started_at = datetime.utcnow().isoformat()
+    deadline = time.perf_counter() + args.duration
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as pool:
+        list(pool.map(worker, range(args.clients)))
+    elapsed = time.perf_counter() - t0
+    after = statements_per_request(make_client())
+
+    routes = summarize(records, elapsed, before, after)
+    print_summary(routes, elapsed)
+    result = {
+        'commit': _commit(), 'started_at': started_at, 'mode': 'http' if args.url else 'in-process',
+        'url': args.url, 'tickets': args.tickets, 'seed': args.seed, 'clients': args.clients,
+        'duration': round(elapsed, 2), 'mix': args.mix, 'routes': routes,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, '%s-%s.json' % (
+        result['commit'] or 'nocommit', datetime.utcnow().strftime('%Y%m%dT%H%M%S')))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=1)
+    print('Results written to %s' % output)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
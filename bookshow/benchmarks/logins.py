@@ -0,0 +1,80 @@
+"""Login throughput benchmark for the password hashing pool.
+
+Signs in buyers through /user/login from many concurrent request threads,
+once per pool size, and reports logins/s and tail latency for each.
+
+    python -m benchmarks.logins --logins 200 --concurrency 32 --pool-sizes 0,1,2,4 --rounds 12
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--buyers', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--pool-sizes', default='0,1,2,4', help='0 hashes inline on the request thread')
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt cost')
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+
+    from flaskshow import create_app, db, passwords
+    from flaskshow.models import Buyer
+    app = create_app()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['BCRYPT_LOG_ROUNDS'] = args.rounds
+    # wait as long as it takes: this measures throughput, not shedding
+    app.config['PASSWORD_QUEUE_TIMEOUT'] = None
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        hashed = passwords._hash('secret', args.rounds)
+        db.session.add_all([Buyer(name='Buyer %d' % i, email='buyer%d@example.com' % i,
+                                  password=hashed, phone='000') for i in range(args.buyers)])
+        db.session.commit()
+
+    def login(i):
+        client = app.test_client()
+        t0 = time.perf_counter()
+        response = client.post('/user/login', data={'email': 'buyer%d@example.com' % (i % args.buyers),
+                                                    'password': 'secret'})
+        return response.status_code == 302, time.perf_counter() - t0
+
+    print('%d logins, %d concurrent requests, bcrypt cost %d' % (args.logins, args.concurrency, args.rounds))
+    print('%-6s %10s %9s %9s %9s %7s' % ('pool', 'logins/s', 'p50 ms', 'p95 ms', 'p99 ms', 'failed'))
+    for size in [int(s) for s in args.pool_sizes.split(',')]:
+        passwords.shutdown()
+        app.config['PASSWORD_WORKERS'] = size
+        login(0)  # start the pool outside the measurement
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = list(pool.map(login, range(args.logins)))
+        elapsed = time.perf_counter() - t0
+        latencies = sorted(latency for _, latency in results)
+        failed = sum(1 for ok, _ in results if not ok)
+        print('%-6s %10.1f %9.1f %9.1f %9.1f %7d' % (
+            size or 'inline', args.logins / elapsed, percentile(latencies, 0.50) * 1000,
+            percentile(latencies, 0.95) * 1000, percentile(latencies, 0.99) * 1000, failed))
+    passwords.shutdown()
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Measure what the request metrics cost.
+
+Serves the same pages with METRICS_ENABLED off and on, interleaving the
+two so drift in the machine affects both alike, and reports the added
+time per request. Also times a /metrics scrape.
+
+    python -m benchmarks.metrics_overhead --requests 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.query_budget import seed
+
+PAGES = ('/', '/shows_list', '/api/venues?limit=20', '/admin')
+ROUNDS = 5
+
+
+def run(client, requests):
+    t0 = time.perf_counter()
+    for i in range(requests):
+        client.get(PAGES[i % len(PAGES)])
+    return (time.perf_counter() - t0) / requests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    os.environ['CACHE_TYPE'] = 'null'  # measure the views, not cache hits
+    from flaskshow import create_app, db, metrics
+    from flaskshow.models import Admin, Buyer, Event, Venue
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        seed(db, (Admin, Buyer, Event, Venue), args.events)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = 'admin:1'
+    run(client, len(PAGES))  # warm up templates and the identity cache
+
+    timings = {False: [], True: []}
+    per_round = max(args.requests // ROUNDS, len(PAGES))
+    for _ in range(ROUNDS):
+        for enabled in (False, True):
+            app.config['METRICS_ENABLED'] = enabled
+            timings[enabled].append(run(client, per_round))
+    off, on = min(timings[False]), min(timings[True])
+    print('metrics off  %7.1f us/request' % (off * 1e6))
+    print('metrics on   %7.1f us/request' % (on * 1e6))
+    print('overhead     %7.1f us/request (%.1f%%)' % ((on - off) * 1e6, (on - off) / off * 100))
+
+    with app.app_context():
+        t0 = time.perf_counter()
+        body = metrics.render()
+    print('scrape       %7.1f ms for %d lines' % ((time.perf_counter() - t0) * 1000, body.count('\n')))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Check that listing pages run a fixed number of SQL statements.
+
+Seeds the database at two sizes and renders each listing page under a
+statement budget. Exits non-zero if a page goes over budget or if its
+statement count grows with the number of rows (an N+1).
+
+    python -m benchmarks.query_budget --sizes 10,500
+    python -m pytest benchmarks/query_budget.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# (endpoint, url, signed in as, statement budget). Signed-in pages are
+# measured after a warm-up request, so the identity comes from the
+# identity cache and costs nothing.
+PAGES = (
+    ('home', '/', None, 1),
+    ('shows_list', '/shows_list', None, 1),
+    ('venues_list', '/venues_list', None, 1),
+    ('user_dashboard', '/user', 'buyer:1', 1),
+    ('admin_dashboard', '/admin', 'admin:1', 4),
+    ('search_results', '/search?query=show', None, 3),
+    ('venue_details', '/venues/1', None, 2),
+)
+
+
+def seed(db, models, size):
+    Admin, Buyer, Event, Venue = models
+    db.session.add(Admin(username='admin', email='admin@example.com', password='x'))
+    db.session.add(Buyer(name='buyer', email='buyer@example.com', password='x', phone='0'))
+    venues = [Venue(name='Venue %d' % i, address='Street %d' % i, capacity=100)
+              for i in range(max(size // 10, 1))]
+    db.session.add_all(venues)
+    db.session.flush()
+    start = datetime(2030, 1, 1)
+    db.session.add_all(Event(name='Show %d' % i, start_time=start + timedelta(hours=i),
+                             end_time=start + timedelta(hours=i + 2),
+                             venue_id=venues[i % len(venues)].id, ticket_price=10.0)
+                       for i in range(size))
+    db.session.commit()
+
+
+def measure(app, db, querycount, url, user_id):
+    client = app.test_client()
+    if user_id:
+        with client.session_transaction() as session:
+            session['_user_id'] = user_id
+        client.get('/user/login')  # loads the identity into the cache
+    with app.app_context():
+        with querycount.count_queries() as counter:
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+    return counter
+
+
+def check(sizes):
+    """Render every page at each size; returns a line per page over budget or growing with rows."""
+    from flaskshow import create_app, db, querycount
+    from flaskshow.models import Admin, Buyer, Event, Venue
+    tmpdir = tempfile.mkdtemp()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmpdir, 'bench.db'),
+                      'RATE_LIMIT_PATH': os.path.join(tmpdir, 'ratelimit.db')})
+
+    counts = {}
+    failures = []
+    for size in sizes:
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            seed(db, (Admin, Buyer, Event, Venue), size)
+        for endpoint, url, user_id, budget in PAGES:
+            counter = measure(app, db, querycount, url, user_id)
+            counts.setdefault(endpoint, []).append(counter.count)
+            status = 'ok' if counter.count <= budget else 'OVER BUDGET'
+            print('%6d events  %-16s %3d statements (budget %d) %s' % (size, endpoint, counter.count, budget, status))
+            if counter.count > budget:
+                print('\n'.join('    ' + s.splitlines()[0] for s in counter.statements))
+                failures.append('%s: %d statements with %d events, budget %d'
+                                % (endpoint, counter.count, size, budget))
+    for endpoint, seen in counts.items():
+        if len(set(seen)) > 1:
+            failures.append('%s: statement count grows with rows: %s' % (endpoint, seen))
+            print(failures[-1])
+    return failures
+
+
+def test_query_budget():
+    # collected when pytest is given this file: `pytest benchmarks/query_budget.py`
+    failures = check([10, 500])
+    assert not failures, '\n'.join(failures)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,500')
+    args = parser.parse_args(argv)
+    return 1 if check([int(s) for s in args.sizes.split(',')]) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Flag full table scans in the SQL each page runs.
+
+Seeds a SQLite database, requests every page below while recording its
+statements, and runs EXPLAIN QUERY PLAN on each one. Exits non-zero when a
+plan scans a table that is not listed as an expected scan for that page,
+so a dropped index or an unindexed new filter fails CI.
+
+    python -m benchmarks.query_plans
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+# (endpoint, method, url, signed in as, form data)
+PAGES = (
+    ('home', 'GET', '/', None, None),
+    ('shows_list', 'GET', '/shows_list', None, None),
+    ('venues_list', 'GET', '/venues_list', None, None),
+    ('user_dashboard', 'GET', '/user', 'buyer:1', None),
+    ('admin_dashboard', 'GET', '/admin', 'admin:1', None),
+    ('sales_report', 'GET', '/api/reports/sales', 'admin:1', None),
+    ('search_results', 'GET', '/search?query=show', None, None),
+    ('user_login', 'POST', '/user/login', None, {'email': 'buyer@example.com', 'password': 'wrong'}),
+    ('admin_login', 'POST', '/admin/login', None, {'email': 'admin@example.com', 'password': 'wrong'}),
+    ('buy_ticket', 'GET', '/buy_ticket/1?quantity=2', 'buyer:1', None),
+    ('get_venues', 'GET', '/api/venues', None, None),
+    ('get_venue', 'GET', '/api/venues/1', None, None),
+    ('get_shows', 'GET', '/api/shows', None, None),
+    ('get_shows_by_venue', 'GET', '/api/shows?venue_id=1&from=2030-01-02', None, None),
+    ('get_show', 'GET', '/api/shows/1', None, None),
+    ('venue_details', 'GET', '/venues/1', None, None),
+    ('venue_calendar', 'GET', '/api/venues/1/calendar?from=2030-01-02&to=2030-01-09', None, None),
+    ('upcoming_shows', 'GET', '/api/shows/upcoming?from=2030-01-02', None, None),
+    ('upcoming_shows_by_venue', 'GET', '/api/shows/upcoming?from=2030-01-02&venue_id=1', None, None),
+)
+
+# Scans that are the point of the page: listings that return every row.
+EXPECTED_SCANS = {
+    'venues_list': {'venue'},
+    # the sales columns cover every event, from the totals rather than the tickets
+    'admin_dashboard': {'venue', 'event'},
+    'sales_report': {'venue', 'event'},
+    'get_venues': {'venue'},
+}
+
+_SCAN = re.compile(r'^SCAN (\w+)(.*)$')
+
+
+def full_scans(plan):
+    """Tables read in full; index scans and virtual tables don't count."""
+    tables = set()
+    for detail in plan:
+        match = _SCAN.match(detail)
+        if match and not re.search(r'USING (COVERING )?INDEX|VIRTUAL TABLE|INTEGER PRIMARY KEY', match.group(2)):
+            tables.add(match.group(1))
+    return tables
+
+
+def explain(connection, statement, parameters):
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters or ()).all()
+    return [row[-1] for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=200, help='events to seed')
+    parser.add_argument('--verbose', action='store_true', help='print every plan')
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    from flaskshow import create_app, db, querycount
+    from flaskshow.models import Admin, Buyer, Event, Ticket, Venue
+    from benchmarks.query_budget import seed
+    app = create_app()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(db, (Admin, Buyer, Event, Venue), args.size)
+        db.session.add_all(Ticket(event_id=i % args.size + 1, buyer_id=1, price=10.0, quantity=1)
+                           for i in range(args.size))
+        db.session.commit()
+        # give the planner real statistics, as a long-lived database has
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+    failed = False
+    for endpoint, method, url, user_id, data in PAGES:
+        client = app.test_client()
+        if user_id:
+            with client.session_transaction() as session:
+                session['_user_id'] = user_id
+        with app.app_context():
+            with querycount.count_queries() as counter:
+                response = client.open(url, method=method, data=data)
+            assert response.status_code < 400, (url, response.status_code)
+            with db.engine.connect() as connection:
+                for statement, parameters in zip(counter.statements, counter.parameters):
+                    if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+                        continue
+                    plan = explain(connection, statement, parameters)
+                    unexpected = full_scans(plan) - EXPECTED_SCANS.get(endpoint, set())
+                    failed |= bool(unexpected)
+                    if unexpected or args.verbose:
+                        print('%-20s %s' % (endpoint, 'FULL SCAN of ' + ', '.join(sorted(unexpected))
+                                            if unexpected else 'ok'))
+                        print('    ' + ' '.join(statement.split())[:200])
+                        print('\n'.join('      ' + detail for detail in plan))
+    print('unexpected full scans found' if failed else 'no unexpected full scans')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Measure what the rate limiter costs, and check it holds across processes.
+
+Serves a limited page with RATE_LIMIT_ENABLED off and on, interleaved, and
+reports the added time per request and the time to turn away a client
+that is over its limit. Then several processes draw from one bucket at
+once; together they must be granted exactly its size.
+
+    python -m benchmarks.ratelimit --requests 2000 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.query_budget import seed
+
+PAGE = '/'  # a light page, so the limiter's share shows up
+ROUNDS = 5
+BUCKET = 500
+
+
+def run(client, requests, expect):
+    t0 = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(PAGE)
+        assert response.status_code == expect, response.status_code
+    return (time.perf_counter() - t0) / requests
+
+
+def _draw(args):
+    path, tries = args
+    from flaskshow.ratelimit import BucketStore
+    bucket = BucketStore(path)
+    # a refill rate too slow to add a token during the run
+    return sum(1 for _ in range(tries) if not bucket.take('bench', BUCKET, 1e-9))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    os.environ['RATE_LIMIT_PATH'] = os.path.join(tmpdir, 'ratelimit.db')
+    os.environ['CACHE_TYPE'] = 'null'
+    from flaskshow import create_app, db, ratelimit
+    from flaskshow.models import Admin, Buyer, Event, Venue
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        seed(db, (Admin, Buyer, Event, Venue), args.events)
+    app.config['RATE_LIMITS'] = {'main.home': (10 ** 9, 1)}
+    client = app.test_client()
+    run(client, 10, 200)
+
+    timings = {False: [], True: []}
+    per_round = max(args.requests // ROUNDS, 1)
+    for _ in range(ROUNDS):
+        for enabled in (False, True):
+            app.config['RATE_LIMIT_ENABLED'] = enabled
+            timings[enabled].append(run(client, per_round, 200))
+    off, on = min(timings[False]), min(timings[True])
+    print('limiter off  %7.1f us/request' % (off * 1e6))
+    print('limiter on   %7.1f us/request' % (on * 1e6))
+    print('overhead     %7.1f us/request (%.1f%%)' % ((on - off) * 1e6, (on - off) / off * 100))
+
+    app.config['RATE_LIMITS'] = {'main.home': (1, 3600)}
+    run(client, 1, 200)
+    rejected = run(client, per_round, 429)
+    print('429          %7.1f us/request' % (rejected * 1e6))
+
+    store = ratelimit.BucketStore(os.path.join(tmpdir, 'shared.db'))
+    t0 = time.perf_counter()
+    take = min(store.take('single', 10 ** 9, 1) for _ in range(args.requests))
+    print('bucket take  %7.1f us' % ((time.perf_counter() - t0) / args.requests * 1e6))
+
+    tries = BUCKET
+    with multiprocessing.Pool(args.processes) as pool:
+        granted = sum(pool.map(_draw, [(store.path, tries)] * args.processes))
+    print('%d processes drew %d times from a bucket of %d: %d granted' % (
+        args.processes, tries * args.processes, BUCKET, granted))
+    return 0 if granted == BUCKET and not take else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Compare the FTS5 search index with the old LIKE '%q%' scans.
+
+Both sides fetch one results page of PER_PAGE rows, loaded the way the
+search page loads them; LIKE has no ranking, so its page is in id order.
+
+    python -m benchmarks.search --sizes 10000,100000,1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+WORDS = ('royal comedy jazz opera night live grand theatre festival rock classic '
+         'summer winter delhi mumbai chennai kolkata pune hall arena club stage '
+         'garden palace music dance drama circus magic kids retro indie').split()
+QUERIES = ('jazz', 'mumbai', 'grand opera', 'pal', 'zzzz')
+PER_PAGE = 20
+
+
+def _name(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).title()
+
+
+def populate(db, Venue, Event, size, seed=1):
+    rng = random.Random(seed)
+    n_venues = max(size // 10, 1)
+    db.session.execute(db.insert(Venue), [
+        {'name': _name(rng, 2), 'address': _name(rng, 3), 'capacity': 500}
+        for _ in range(n_venues)])
+    start = datetime(2030, 1, 1)
+    for offset in range(0, size, 10000):
+        db.session.execute(db.insert(Event), [
+            {'name': _name(rng, 3), 'start_time': start + timedelta(hours=i),
+             'end_time': start + timedelta(hours=i + 2), 'venue_id': rng.randint(1, n_venues),
+             'ticket_price': 10.0}
+            for i in range(offset, min(offset + 10000, size))])
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000', help='comma separated event counts')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    from sqlalchemy.orm import joinedload
+    from flaskshow import create_app, db, search
+    from flaskshow.models import Event, Venue
+    app = create_app()
+
+    print('%10s %-12s %10s %10s' % ('events', 'query', 'like ms', 'fts ms'))
+    with app.app_context():
+        for size in (int(s) for s in args.sizes.split(',')):
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            populate(db, Venue, Event, size)
+            search.rebuild()
+            for query in QUERIES:
+                pattern = '%{}%'.format(query)
+
+                def like():
+                    # one row past the page, as search() fetches to tell if there is a next page
+                    venues = (Venue.query.filter(Venue.address.like(pattern))
+                              .order_by(Venue.id).limit(PER_PAGE + 1).all())
+                    (Event.query.options(joinedload(Event.venue)).filter(Event.name.like(pattern))
+                     .order_by(Event.id).limit(PER_PAGE + 1 - len(venues)).all())
+
+                def fts():
+                    search.search(query, per_page=PER_PAGE)
+
+                print('%10d %-12s %10.2f %10.2f' % (size, query, timed(like, args.repeat), timed(fts, args.repeat)))
+                db.session.expunge_all()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
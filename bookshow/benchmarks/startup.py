@@ -0,0 +1,96 @@
+"""Measure how long a fresh process takes to serve its first request.
+
+Starts --runs new interpreters, one after another. Each times importing
+the package, create_app(), and its first requests to / and /api/venues.
+It also forks once after create_app(), as gunicorn --preload does, and
+times the first request in the forked worker. Reports the median and
+best of each step, and whether the slow optional imports (Pillow,
+bcrypt, alembic) were loaded.
+
+    python -m benchmarks.startup --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs in each fresh interpreter; prints one JSON line of timings in ms.
+CHILD = r'''
+import json, os, sys, time
+t0 = time.perf_counter()
+import flaskshow
+t1 = time.perf_counter()
+app = flaskshow.create_app()
+t2 = time.perf_counter()
+read, write = os.pipe()
+pid = os.fork()
+if pid == 0:
+    os.close(read)
+    started = time.perf_counter()
+    status = app.test_client().get('/').status_code
+    os.write(write, json.dumps([status, time.perf_counter() - started]).encode())
+    os._exit(0)
+os.close(write)
+fork_status, forked = json.loads(os.read(read, 256))
+os.waitpid(pid, 0)
+client = app.test_client()
+t3 = time.perf_counter()
+home = client.get('/').status_code
+t4 = time.perf_counter()
+api = client.get('/api/venues').status_code
+t5 = time.perf_counter()
+print(json.dumps({
+    'import': (t1 - t0) * 1000, 'create_app': (t2 - t1) * 1000, 'first_home': (t4 - t3) * 1000,
+    'first_api': (t5 - t4) * 1000, 'ready': (t4 - t0) * 1000, 'forked_first_home': forked * 1000,
+    'statuses': [home, api, fork_status],
+    'loaded': {name: name in sys.modules for name in ('PIL', 'bcrypt', 'alembic')},
+}))
+'''
+
+STEPS = ('import', 'create_app', 'first_home', 'first_api', 'ready', 'forked_first_home')
+
+
+def run_once(cwd, env):
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=cwd, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help='also write every run and the summary to this JSON file')
+    args = parser.parse_args(argv)
+
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    tmpdir = tempfile.mkdtemp()
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tmpdir, 'bench.db'), CACHE_TYPE='null',
+               RATE_LIMIT_PATH=os.path.join(tmpdir, 'ratelimit.db'), PYTHONPATH=cwd)
+    subprocess.run([sys.executable, '-c', 'from flaskshow import create_app, db\n'
+                    'with create_app().app_context(): db.create_all()'], cwd=cwd, env=env, check=True)
+
+    runs = [run_once(cwd, env) for _ in range(args.runs)]
+    bad = [run['statuses'] for run in runs if set(run['statuses']) != {200}]
+    summary = {step: {'median_ms': round(statistics.median(run[step] for run in runs), 1),
+                      'best_ms': round(min(run[step] for run in runs), 1)} for step in STEPS}
+    print('%-18s %10s %10s' % ('step', 'median ms', 'best ms'))
+    for step in STEPS:
+        print('%-18s %10.1f %10.1f' % (step, summary[step]['median_ms'], summary[step]['best_ms']))
+    loaded = runs[-1]['loaded']
+    print('loaded at first request: %s' % ', '.join(
+        '%s %s' % (name, 'yes' if is_loaded else 'no') for name, is_loaded in loaded.items()))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'runs': runs, 'summary': summary, 'loaded': loaded}, f, indent=1)
+        print('Results written to %s' % args.output)
+    if bad:
+        print('unexpected statuses: %s' % bad)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
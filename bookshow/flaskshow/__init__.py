@@ -1,29 +1,135 @@
+import os
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
-from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
+from flaskshow.engine import READER, RoutingSession, configure_engine, engine_options
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = '5e14a40fcda83b6d909ff639f40cccb4'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
-app.config['WTF_CSRF_SSL_STRICT'] = True
-app.config['SESSION_COOKIE_SECURE'] = False
+# Extensions are created unbound and attached to each app in create_app(),
+# so importing the package builds nothing and opens nothing.
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+csrf = CSRFProtect()
+# One manager for both account types: an app only has one, and a second
+# init_app() silently replaced the first's user loader.
+login_manager = LoginManager()
+login_manager.login_view = 'buyer.user_login'
 
 
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-migrate = Migrate(app, db)
-csrf = CSRFProtect(app)
+def default_config():
+    """The settings create_app() starts from, read from the environment."""
+    config = {}
+    config['SECRET_KEY'] = '5e14a40fcda83b6d909ff639f40cccb4'
+    config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///site.db')
+    config['DATABASE_READ_URL'] = os.environ.get('DATABASE_READ_URL')  # optional read replica
+    config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # ms
+    config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    config['SQLITE_CACHE_SIZE'] = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))  # KiB when negative
+    config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+    config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    config['WTF_CSRF_SSL_STRICT'] = True
+    config['SESSION_COOKIE_SECURE'] = False
+    config['SEAT_HOLD_SECONDS'] = int(os.environ.get('SEAT_HOLD_SECONDS', 300))
+    config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'lru')  # lru, sqlite or null
+    config['CACHE_DEFAULT_TIMEOUT'] = 300
+    config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+    config['IMAGE_POOL'] = os.environ.get('IMAGE_POOL', 'thread')  # thread or process
+    config['STATIC_OFFLOAD'] = os.environ.get('STATIC_OFFLOAD')  # x-sendfile or x-accel for event_images
+    config['STATIC_ACCEL_PREFIX'] = os.environ.get('STATIC_ACCEL_PREFIX', '/protected/')
+    config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    config['PASSWORD_WORKERS'] = int(os.environ.get('PASSWORD_WORKERS', os.cpu_count() or 1))  # 0 hashes inline
+    config['PASSWORD_QUEUE_FACTOR'] = 4
+    config['PASSWORD_QUEUE_TIMEOUT'] = 2
+    config['IDENTITY_TTL'] = int(os.environ.get('IDENTITY_TTL', 300))
+    config['IDENTITY_CACHE_SIZE'] = int(os.environ.get('IDENTITY_CACHE_SIZE', 10000))  # accounts per worker
+    config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+    config['METRICS_DIR'] = os.environ.get('METRICS_DIR')  # shared by the workers of a multi-process server
+    config['METRICS_FLUSH_SECONDS'] = 5
+    config['METRICS_ALLOW'] = os.environ.get('METRICS_ALLOW', '127.0.0.1,::1')  # addresses or networks, comma separated
+    config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # or scrape from anywhere with this bearer token
+    config['PROFILER_ENABLED'] = os.environ.get('PROFILER_ENABLED', '0') == '1'  # profile every request
+    config['PROFILE_HEADER'] = 'X-Profile-Token'  # or per request, with a token from `flask profile-token`
+    config['PROFILE_TOKEN_MAX_AGE'] = 3600
+    config['PROFILE_CPROFILE'] = os.environ.get('PROFILE_CPROFILE', '0') == '1'
+    config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')  # default instance/profiles
+    config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 200))  # 0 turns the log off
+    config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG')  # default instance/slow_queries.log
+    config['SLOW_QUERY_LOG_BYTES'] = 10 * 1024 * 1024
+    config['SLOW_QUERY_LOG_BACKUPS'] = 5
+    # slow query log and profiles record parameter types only, unless this is on
+    config['LOG_QUERY_PARAMETERS'] = os.environ.get('LOG_QUERY_PARAMETERS', '0') == '1'
+    config['WAITING_ROOM_ENABLED'] = os.environ.get('WAITING_ROOM_ENABLED', '1') == '1'
+    config['WAITING_ROOM_PATH'] = os.environ.get('WAITING_ROOM_PATH')  # default instance/waiting_room.db
+    config['WAITING_ROOM_RATE'] = float(os.environ.get('WAITING_ROOM_RATE', 10))  # buyers/s per event
+    config['WAITING_ROOM_BURST'] = int(os.environ.get('WAITING_ROOM_BURST', 20))  # let straight in when quiet
+    config['WAITING_ROOM_ADMIT_SECONDS'] = 900  # how long an admitted buyer may keep buying
+    config['WAITING_ROOM_TOKEN_MAX_AGE'] = 6 * 3600
+    config['WAITING_ROOM_SOLD_OUT_SECONDS'] = 30
+    config['ASYNC_DATABASE_URL'] = os.environ.get('ASYNC_DATABASE_URL')  # asgi.py; default: the database, async driver
+    config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+    config['RATE_LIMIT_PATH'] = os.environ.get('RATE_LIMIT_PATH')  # default instance/ratelimit.db
+    # (requests, seconds) per client: the signed-in buyer or admin, else the address
+    config['RATE_LIMITS'] = {
+        'main.search_results': (60, 60),
+        'buyer.buy_ticket': (60, 60),
+        'api.cart_checkout': (30, 60),
+        'POST buyer.user_login': (10, 60),
+        'POST admin.admin_login': (10, 60),
+        'POST buyer.user_signup': (5, 300),
+        'POST admin.admin_signup': (5, 300),
+        'api.create_venue': (60, 60),
+        'api.update_venue': (60, 60),
+        'api.delete_venue': (60, 60),
+        'api.create_show': (60, 60),
+        'api.update_show': (60, 60),
+        'api.delete_show': (60, 60),
+        'api.bulk_import': (10, 60),
+    }
+    return config
 
 
-user_login_manager = LoginManager()
-user_login_manager.login_view = 'user_login'
-user_login_manager.init_app(app)
+def create_app(config=None):
+    """Build the application; config overrides default_config().
 
-admin_login_manager = LoginManager()
-admin_login_manager.login_view = 'admin_login'
-admin_login_manager.init_app(app)
+    Nothing here connects to a database or starts a thread, so a server
+    can build the app once before forking its workers (gunicorn
+    --preload) and share the imported code copy-on-write.
+    """
+    app = Flask(__name__)
+    app.config.update(default_config())
+    app.config.update(config or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    if app.config['DATABASE_READ_URL']:
+        app.config['SQLALCHEMY_BINDS'] = {READER: {
+            'url': app.config['DATABASE_READ_URL'],
+            **engine_options(app.config['DATABASE_READ_URL'], app.config)}}
 
-from flaskshow import routes
+    db.init_app(app)
+    if click.get_current_context(silent=True) is not None:
+        # Only the `flask db` commands need Flask-Migrate, and it imports
+        # alembic; a server's workers never run a migration.
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    csrf.init_app(app)
+    login_manager.init_app(app)
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        configure_engine(engine, app.config)
+
+    # Imported here rather than at the top: they need the extensions above,
+    # and the views pull in most of the package.
+    from flaskshow import (assets, bulk, export, identity, images, inventory, metrics, profiler,
+                           ratelimit, routes, sales, schedule, search, waiting_room)
+    from flaskshow.cache import cache
+    for extension in (ratelimit, assets, cache, metrics, profiler):
+        extension.init_app(app)
+    for blueprint in (routes.main, routes.buyers, routes.admins, routes.api):
+        app.register_blueprint(blueprint)
+    for module in (assets, bulk, export, images, inventory, profiler, sales, schedule, search, waiting_room):
+        for command in module.COMMANDS:
+            app.cli.add_command(command)
+    return app
@@ -0,0 +1,153 @@
+import click
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+try:
+    import brotli
+except ImportError:  # optional; only needed by assets-build
+    brotli = None
+
+FINGERPRINT_LENGTH = 10
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Precompressed copies are only worth it for text; images are already compressed.
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.map')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_FINGERPRINTED = re.compile(r'^(.+)\.([0-9a-f]{%d})(\.[^./]+)$' % FINGERPRINT_LENGTH)
+
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+
+def _content_hash(path):
+    # Memoized on (mtime, size), so a deploy or an edited file is picked up
+    # without a restart and an unchanged file is only ever read once.
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _hashes.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    fingerprint = digest.hexdigest()[:FINGERPRINT_LENGTH]
+    with _hashes_lock:
+        _hashes[path] = (key, fingerprint)
+    return fingerprint
+
+
+def fingerprint(filename):
+    """main.css -> main.<hash>.css, or filename unchanged if it doesn't exist."""
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return '%s.%s%s' % (stem, _content_hash(path), ext)
+
+
+def resolve(filename):
+    """Map a requested static name to (real filename, is current fingerprint)."""
+    match = _FINGERPRINTED.match(filename)
+    if match:
+        real = match.group(1) + match.group(3)
+        path = safe_join(current_app.static_folder, real)
+        if path and os.path.isfile(path):
+            # A stale fingerprint (a page cached across a deploy) still gets
+            # the current file, just without the long-lived cache header.
+            return real, _content_hash(path) == match.group(2)
+    return filename, False
+
+
+def fingerprint_static_urls(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = fingerprint(values['filename'])
+
+
+def _precompressed(filename):
+    accepted = request.accept_encodings
+    for encoding, suffix in ENCODINGS:
+        if accepted[encoding]:
+            path = safe_join(current_app.static_folder, filename + suffix)
+            source = safe_join(current_app.static_folder, filename)
+            if path and os.path.isfile(path) and os.path.getmtime(path) >= os.path.getmtime(source):
+                return encoding, filename + suffix
+    return None, None
+
+
+def _offload(filename, immutable):
+    """Hand an event image to the front-end server instead of streaming it."""
+    mode = current_app.config.get('STATIC_OFFLOAD')
+    if mode == 'x-accel':
+        response = current_app.response_class(mimetype=mimetypes.guess_type(filename)[0])
+        response.headers['X-Accel-Redirect'] = current_app.config['STATIC_ACCEL_PREFIX'] + filename
+    else:
+        response = send_file(safe_join(current_app.static_folder, filename), request.environ,
+                             use_x_sendfile=True, response_class=current_app.response_class)
+    if immutable:
+        response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def serve_static(filename):
+    real, immutable = resolve(filename)
+    if real.startswith('event_images/') and current_app.config.get('STATIC_OFFLOAD'):
+        if not os.path.isfile(safe_join(current_app.static_folder, real) or ''):
+            raise NotFound()
+        return _offload(real, immutable)
+
+    max_age = 31536000 if immutable else None
+    encoding, compressed = _precompressed(real) if real.endswith(COMPRESSIBLE) else (None, None)
+    if encoding:
+        response = send_from_directory(current_app.static_folder, compressed, max_age=max_age,
+                                       mimetype=mimetypes.guess_type(real)[0])
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(current_app.static_folder, real, max_age=max_age)
+    if real.endswith(COMPRESSIBLE):
+        response.vary.add('Accept-Encoding')
+    if immutable:
+        response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def init_app(app):
+    app.url_defaults(fingerprint_static_urls)
+    app.view_functions['static'] = serve_static
+
+
+@click.command('assets-build')
+@with_appcontext
+def assets_build_command():
+    """Write gzip and brotli copies of the compressible static files."""
+    written = 0
+    for root, dirs, files in os.walk(current_app.static_folder):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, 9, mtime=0))
+            written += 1
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(data, quality=11))
+                written += 1
+    if brotli is None:
+        print('brotli is not installed; only gzip copies were written.')
+    print('Wrote %d precompressed files.' % written)
+
+
+COMMANDS = (assets_build_command,)
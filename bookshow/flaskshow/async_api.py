@@ -0,0 +1,204 @@
+"""The read-only JSON API as a plain ASGI application (see asgi.py).
+
+Serves the same URLs and the same responses as the Flask views for
+/api/venues and /api/shows, but as coroutines on an async engine. A
+waiting query then costs a coroutine rather than a worker thread, and a
+few processes can keep thousands of polling clients connected.
+Everything else stays on the WSGI app; route only these paths here.
+"""
+import asyncio
+import json
+import re
+from urllib.parse import parse_qs
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+from flaskshow import db, pagination, profiler, versioning
+from flaskshow.engine import READER, configure_engine, engine_options
+from flaskshow.models import Event, Venue
+from flaskshow.routes import SHOW_EXTRA_FIELDS, SHOW_FIELDS, VENUE_FIELDS
+
+# The async driver for each database the app can run on.
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg', 'mysql': 'mysql+aiomysql'}
+
+flask_app = None  # the app whose config and database are served; see init_app()
+_engine = None
+_versions = {}  # table names -> the version read in flight
+
+
+class NotFound(Exception):
+    pass
+
+
+def async_url():
+    """The replica if there is one, else the primary, through its async driver."""
+    if flask_app.config['ASYNC_DATABASE_URL']:
+        return flask_app.config['ASYNC_DATABASE_URL']
+    with flask_app.app_context():
+        # the engines' URLs, which have relative SQLite paths resolved
+        url = (db.engines[READER] if READER in db.engines else db.engine).url
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def engine():
+    global _engine
+    if _engine is None:
+        url = async_url()
+        _engine = create_async_engine(url, **engine_options(str(url), flask_app.config))
+        configure_engine(_engine.sync_engine, flask_app.config)
+        profiler.watch(_engine.sync_engine, flask_app)
+    return _engine
+
+
+async def _read_versions(names):
+    async with engine().connect() as conn:
+        return versioning.validators(names, (await conn.execute(versioning.versions_query(names))).all())
+
+
+async def current(names):
+    """(etag, last_modified) for the tables, as versioning.current().
+
+    Requests arriving while a read of the same versions is in flight wait
+    for that read instead of starting their own, so a crowd of pollers
+    costs one query at a time.
+    """
+    pending = _versions.get(names)
+    if pending is None:
+        pending = _versions[names] = asyncio.ensure_future(_read_versions(names))
+        pending.add_done_callback(lambda done: _versions.pop(names, None) if _versions.get(names) is done else None)
+    return await asyncio.shield(pending)
+
+
+async def _page(args, model, allowed, default, order_by, filters=()):
+    # as routes._api_page()
+    fields = pagination.parse_fields(args.get('fields'), allowed, default)
+    limit = None if pagination.parse_bool(args.get('all'), 'all') else pagination.parse_limit(args.get('limit'))
+    query = pagination.keyset_query(model, fields, order_by, filters, cursor=args.get('cursor'), limit=limit)
+    async with engine().connect() as conn:
+        rows = (await conn.execute(query)).mappings().all()
+    return pagination.keyset_result(rows, fields, order_by, limit)
+
+
+async def _one(query):
+    async with engine().connect() as conn:
+        row = (await conn.execute(query)).first()
+    if row is None:
+        raise NotFound()
+    return row
+
+
+async def get_venues(args):
+    venues, next_cursor = await _page(args, Venue, VENUE_FIELDS, VENUE_FIELDS, ['id'])
+    if pagination.parse_bool(args.get('all'), 'all'):
+        return {'venues': venues}
+    return {'venues': venues, 'next': next_cursor}
+
+
+async def get_venue(args, venue_id):
+    venue = await _one(select(Venue.id, Venue.name, Venue.address, Venue.capacity).where(Venue.id == venue_id))
+    return {'venue': dict(venue._mapping)}
+
+
+async def get_shows(args):
+    filters = []
+    venue_id = pagination.parse_int(args.get('venue_id'), 'venue_id')
+    if venue_id is not None:
+        filters.append(Event.venue_id == venue_id)
+    starts_from = pagination.parse_datetime(args.get('from'), 'from')
+    if starts_from is not None:
+        filters.append(Event.start_time >= starts_from)
+    starts_to = pagination.parse_datetime(args.get('to'), 'to')
+    if starts_to is not None:
+        filters.append(Event.start_time < starts_to)
+    shows, next_cursor = await _page(args, Event, SHOW_FIELDS + SHOW_EXTRA_FIELDS, SHOW_FIELDS,
+                                     ['start_time', 'id'], filters)
+    if pagination.parse_bool(args.get('all'), 'all'):
+        return {'shows': shows}
+    return {'shows': shows, 'next': next_cursor}
+
+
+async def get_show(args, show_id):
+    show = await _one(select(Event.id, Event.name, Event.start_time, Event.end_time, Event.venue_id)
+                      .where(Event.id == show_id))
+    return {'show': {'id': show.id, 'name': show.name, 'start_time': show.start_time.isoformat(),
+                     'end_time': show.end_time.isoformat(), 'venue_id': show.venue_id}}
+
+
+# (path, tables whose versions are the ETag, view), as in routes.py
+ROUTES = (
+    (re.compile(r'/api/venues'), ('venue',), get_venues),
+    (re.compile(r'/api/venues/(\d+)'), ('venue',), get_venue),
+    (re.compile(r'/api/shows'), ('event',), get_shows),
+    (re.compile(r'/api/shows/(\d+)'), ('event',), get_show),
+)
+
+
+def _json(payload):
+    # byte for byte what Flask's jsonify() sends
+    return (json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+def _not_modified(headers, etag, last_modified):
+    if 'if-none-match' in headers:
+        return parse_etags(headers['if-none-match']).contains_weak(etag)
+    since = parse_date(headers.get('if-modified-since'))
+    return bool(since and last_modified and last_modified <= since)
+
+
+async def respond(scope):
+    """(status, headers, body) for an HTTP request."""
+    if scope['method'] not in ('GET', 'HEAD'):
+        return 405, [('allow', 'GET, HEAD')], b''
+    for pattern, names, view in ROUTES:
+        match = pattern.fullmatch(scope['path'])
+        if match:
+            break
+    else:
+        return 404, [('content-type', 'application/json')], _json({'errors': {'path': ['Not found.']}})
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    args = {name: values[0] for name, values in
+            parse_qs(scope['query_string'].decode('latin-1'), keep_blank_values=True).items()}
+    etag, last_modified = await current(names)
+    if _not_modified(headers, etag, last_modified):
+        status, body = 304, b''
+    else:
+        try:
+            status, body = 200, _json(await view(args, *(int(group) for group in match.groups())))
+        except pagination.InvalidQuery as error:
+            return 400, [('content-type', 'application/json')], _json({'errors': {'query': [str(error)]}})
+        except NotFound:
+            return 404, [('content-type', 'application/json')], _json({'errors': {'id': ['Not found.']}})
+    response_headers = [('etag', quote_etag(etag, weak=True)), ('cache-control', 'no-cache')]
+    if status == 200:
+        response_headers.append(('content-type', 'application/json'))
+    if last_modified:
+        response_headers.append(('last-modified', http_date(last_modified)))
+    return status, response_headers, body
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                engine()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if _engine is not None:
+                    await _engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    status, headers, body = await respond(scope)
+    headers.append(('content-length', str(len(body))))
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]})
+    await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+
+def init_app(app):
+    """Serve the read-only API of the Flask app; returns the ASGI application."""
+    global flask_app
+    flask_app = app
+    return application
@@ -0,0 +1,362 @@
+import csv
+import json
+import re
+import click
+from bisect import bisect_left, insort
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DBAPIError
+from flaskshow import db, inventory, sales, schedule, search
+from flaskshow.cache import cache
+from flaskshow.forms import BuyTicketForm, EventForm, VenueForm
+from flaskshow.models import Event, Ticket, Venue
+from flaskshow.versioning import bump
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ('csv', 'ndjson')
+# Streams are decoded with errors='surrogateescape', which turns bytes that
+# are not UTF-8 into these, so a bad line can be reported on its own.
+UNDECODABLE = re.compile('[\udc80-\udcff]')
+NOT_UTF8 = 'not valid UTF-8'
+
+
+class InvalidImport(ValueError):
+    pass
+
+
+def detect_format(fmt=None, mimetype=None, filename=None):
+    if fmt:
+        if fmt not in FORMATS:
+            raise InvalidImport('format must be one of: %s' % ', '.join(FORMATS))
+        return fmt
+    if mimetype == 'text/csv' or (filename or '').endswith('.csv'):
+        return 'csv'
+    if mimetype in ('application/x-ndjson', 'application/jsonl') or (filename or '').endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    raise InvalidImport('send text/csv or application/x-ndjson, or pass format=csv|ndjson')
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict, parse error) from a text stream, lazily.
+
+    Open the stream with errors='surrogateescape' so a line that is not
+    UTF-8 is one line's error. A strict stream stops at the first such
+    block with an error instead.
+    """
+    line = 0
+    try:
+        for line, row, error in (_read_csv(stream) if fmt == 'csv' else _read_ndjson(stream)):
+            yield line, row, error
+    except UnicodeDecodeError:
+        # a strict stream decodes a block at a time, so the bad byte is on this line or a little after
+        yield line + 1, None, NOT_UTF8 + ' from here on; nothing after this line was read'
+
+
+def _read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        # line_num is the last physical line read; line 1 is the header
+        if any(UNDECODABLE.search(value) for value in row.values() if isinstance(value, str)):
+            yield reader.line_num, None, NOT_UTF8
+        else:
+            yield reader.line_num, row, None
+
+
+def _read_ndjson(stream):
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        if UNDECODABLE.search(text):
+            yield line, None, NOT_UTF8
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as error:
+            yield line, None, str(error)
+            continue
+        if isinstance(row, dict):
+            yield line, row, None
+        else:
+            yield line, None, 'each line must be a JSON object'
+
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {'inserted': self.inserted, 'failed': self.failed, 'errors': self.errors,
+                'errors_truncated': self.failed > len(self.errors)}
+
+
+class _RowData(dict):
+    # the one formdata method fields use
+    def getlist(self, key):
+        value = self.get(key)
+        return [] if value is None else [str(value)]
+
+
+class RowValidator:
+    """Apply the rules of some of a form's fields to plain row dicts.
+
+    Binding a WTForms form costs more than validating it, so one form is
+    bound up front and its fields re-processed for every row.
+    """
+
+    def __init__(self, form_class, fields):
+        self.form = form_class(formdata=None, meta={'csrf': False})
+        self.fields = [self.form[name] for name in fields]
+
+    def __call__(self, row):
+        """Returns (form, {field: [errors]}); form holds the row's coerced data."""
+        data = _RowData(row)
+        errors = {}
+        for field in self.fields:
+            field.process(data)
+            if not field.validate(self.form):
+                errors[field.name] = list(field.errors)
+        return self.form, errors
+
+
+def _parse_datetime(raw):
+    try:
+        return datetime.fromisoformat(str(raw).strip())
+    except ValueError:
+        return None
+
+
+def _venue_values(row, context):
+    form, errors = context['form'](row)
+    if errors:
+        return None, errors
+    return {'name': form.name.data, 'address': form.address.data, 'capacity': form.capacity.data}, None
+
+
+def _event_values(row, context):
+    # EventForm's venue choices are checked against the prefetched venue ids
+    # instead; a SelectField with every venue as a choice is a linear scan
+    # per row.
+    form, errors = context['form'](row)
+    values = {'name': form.name.data, 'ticket_price': float(form.ticket_price.data or 0)}
+    for name in ('start_time', 'end_time'):
+        values[name] = _parse_datetime(row.get(name)) if name not in errors else None
+        if name not in errors and values[name] is None:
+            errors[name] = ['Use YYYY-MM-DD HH:MM.']
+    try:
+        values['venue_id'] = int(row.get('venue_id'))
+    except (TypeError, ValueError):
+        values['venue_id'] = None
+    if values['venue_id'] not in context['venue_ids']:
+        errors['venue_id'] = ['Not a valid venue.']
+    return (None, errors) if errors else (values, None)
+
+
+def _ticket_values(row, context):
+    form, errors = context['form'](row)
+    try:
+        event_id = int(row.get('event_id'))
+    except (TypeError, ValueError):
+        event_id = None
+    if event_id not in context['prices']:
+        errors['event_id'] = ['Not a valid event.']
+    values = {'event_id': event_id, 'quantity': form.quantity.data, 'buyer_id': None, 'price': None}
+    try:
+        if row.get('buyer_id') not in (None, ''):
+            values['buyer_id'] = int(row['buyer_id'])
+        values['price'] = (float(row['price']) if row.get('price') not in (None, '')
+                           else context['prices'].get(event_id))
+    except (TypeError, ValueError):
+        errors['price'] = ['Not a valid number.']
+    return (None, errors) if errors else (values, None)
+
+
+# Each insert_* runs inside the batch's transaction and returns
+# (rows inserted, [(line, errors)] for rows it turned away).
+
+def _insert_venues(batch):
+    connection = db.session.connection()
+    rows = db.session.execute(insert(Venue).returning(Venue.id, Venue.name, Venue.address),
+                              [values for _, values in batch]).all()
+    # bulk inserts skip the session's after_flush hooks; do their work here
+    search.add_documents(connection, 'venue', rows)
+    bump(connection, 'venue')
+    return len(rows), []
+
+
+def _batch_clash(booked, start, end):
+    """The (start, end, line, name) in booked, sorted by start, that overlaps [start, end)."""
+    # bookings at a venue never overlap each other, so only the neighbours can clash
+    i = bisect_left(booked, (start,))
+    if i > 0 and booked[i - 1][1] > start:
+        return booked[i - 1]
+    if i < len(booked) and booked[i][0] < end:
+        return booked[i]
+    return None
+
+
+def _event_clashes(line, values, booked):
+    """Errors for a row that breaks the venue schedule; books the row otherwise.
+
+    booked maps venue ids to the events already there and the batch's rows
+    so far, as sorted (start, end, line, name) tuples; line is None for an
+    event in the database.
+    """
+    start, end = values['start_time'], values['end_time']
+    try:
+        schedule.check_interval(start, end)
+    except ValueError as error:
+        return {'end_time': [str(error)]}
+    at_venue = booked.setdefault(values['venue_id'], [])
+    clash = _batch_clash(at_venue, start, end)
+    if clash is None:
+        insort(at_venue, (start, end, line, values['name']))
+        return None
+    if clash[2] is not None:
+        return {'start_time': ['Clashes with line %s of this import.' % clash[2]]}
+    return {'start_time': ['Clashes with "%s" (%s to %s) at this venue.'
+                           % (clash[3], clash[0].isoformat(' '), clash[1].isoformat(' '))]}
+
+
+def _booked(batch):
+    """The events already at the batch's venues during its span, as _event_clashes() takes them."""
+    booked = {}
+    spans = [values for _, values in batch if values['start_time'] < values['end_time']]
+    if spans:
+        rows = schedule.booked({values['venue_id'] for values in spans},
+                               min(values['start_time'] for values in spans),
+                               max(values['end_time'] for values in spans))
+        for row in rows:
+            booked.setdefault(row.venue_id, []).append((row.start_time, row.end_time, None, row.name))
+    return booked
+
+
+def _insert_events(batch):
+    # the schedule.check() rules, with one query for the whole batch
+    accepted, rejected, booked = [], [], _booked(batch)
+    for line, values in batch:
+        errors = _event_clashes(line, values, booked)
+        if errors:
+            rejected.append((line, errors))
+        else:
+            accepted.append(values)
+    if not accepted:
+        return 0, rejected
+    connection = db.session.connection()
+    rows = db.session.execute(insert(Event).returning(Event.id, Event.name), accepted).all()
+    search.add_documents(connection, 'event', ((id, name, '') for id, name in rows))
+    bump(connection, 'event')
+    return len(rows), rejected
+
+
+def _insert_tickets(batch):
+    allocated, rejected = [], []
+    granted = inventory.allocate([(values['event_id'], values['quantity']) for _, values in batch])
+    for (line, values), ok in zip(batch, granted):
+        if ok:
+            allocated.append(values)
+        else:
+            rejected.append((line, {'quantity': ['Not enough seats left.']}))
+    if allocated:
+        db.session.execute(insert(Ticket), allocated)
+        sales.record_tickets(db.session.connection(),
+                             [(values['event_id'], values['quantity'], values['price']) for values in allocated])
+    return len(allocated), rejected
+
+
+def _venue_context():
+    return {'form': RowValidator(VenueForm, ('name', 'address', 'capacity'))}
+
+
+def _event_context():
+    return {'form': RowValidator(EventForm, ('name', 'start_time', 'end_time', 'ticket_price')),
+            'venue_ids': set(db.session.scalars(select(Venue.id)))}
+
+
+def _ticket_context():
+    return {'form': RowValidator(BuyTicketForm, ('quantity',)),
+            'prices': dict(db.session.execute(select(Event.id, Event.ticket_price)).all())}
+
+
+# kind -> (prefetch, validate row, insert batch, cache tag)
+KINDS = {
+    'venues': (_venue_context, _venue_values, _insert_venues, 'venues'),
+    'events': (_event_context, _event_values, _insert_events, 'events'),
+    'tickets': (_ticket_context, _ticket_values, _insert_tickets, None),
+}
+
+
+def _write(kind, batch, result):
+    insert_batch, tag = KINDS[kind][2], KINDS[kind][3]
+    try:
+        with inventory.write_transaction():
+            inserted, rejected = insert_batch(batch)
+    except DBAPIError:
+        if len(batch) == 1:
+            result.error(batch[0][0], {'row': ['Rejected by the database.']})
+            return
+        # find the offending rows; the rest of the batch still goes in
+        for row in batch:
+            _write(kind, [row], result)
+        return
+    result.inserted += inserted
+    for line, errors in rejected:
+        result.error(line, errors)
+    if tag:
+        cache.invalidate(tag)
+
+
+def import_rows(kind, rows):
+    """Validate and insert (line, row, parse error) tuples in batches.
+
+    Each batch of BATCH_SIZE valid rows is one transaction with one
+    executemany INSERT. Invalid rows are reported and skipped.
+    """
+    prefetch, validate = KINDS[kind][0], KINDS[kind][1]
+    context = prefetch()
+    db.session.commit()
+    result = ImportResult()
+    batch = []
+    for line, row, parse_error in rows:
+        if parse_error:
+            result.error(line, {'row': [parse_error]})
+            continue
+        values, errors = validate(row, context)
+        if errors:
+            result.error(line, errors)
+            continue
+        batch.append((line, values))
+        if len(batch) >= BATCH_SIZE:
+            _write(kind, batch, result)
+            batch = []
+    if batch:
+        _write(kind, batch, result)
+    return result
+
+
+@click.command('import-data')
+@with_appcontext
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('source', type=click.File('r', encoding='utf-8', errors='surrogateescape', lazy=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='defaults to the file extension')
+def import_data_command(kind, source, fmt):
+    """Bulk import venues, events or ticket allocations from CSV or NDJSON."""
+    try:
+        fmt = detect_format(fmt, filename=source.name)
+    except InvalidImport as error:
+        raise click.UsageError(str(error))
+    result = import_rows(kind, read_rows(source, fmt))
+    for error in result.errors:
+        print('line %s: %s' % (error['line'], json.dumps(error['errors'])))
+    print('Imported %d %s, %d rows rejected.' % (result.inserted, kind, result.failed))
+
+
+COMMANDS = (import_data_command,)
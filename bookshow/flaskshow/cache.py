@@ -0,0 +1,218 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, request, session
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from flaskshow.models import Event, Venue
+
+# Which cache tags a write to each model invalidates.
+MODEL_TAGS = {Venue: 'venues', Event: 'events'}
+
+
+class NullBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout):
+        pass
+
+    def version(self, tag):
+        return 0
+
+    def bump(self, tag):
+        pass
+
+
+class LRUBackend:
+    """In-process LRU with per-entry TTL. Only coherent for a single worker."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def version(self, tag):
+        return self._versions.get(tag, 0)
+
+    def bump(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+
+class SQLiteBackend:
+    """Cache stored in its own SQLite file, shared by every worker on the host.
+
+    Kept out of the main database so cache writes never queue behind
+    ticket sales for the write lock.
+    """
+
+    PURGE_EVERY = 100
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+        # created before a preloading server forks, so the schema connection
+        # is closed again rather than kept and shared with the workers
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entry '
+                         '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entry_expires ON cache_entry (expires)')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_version '
+                         '(tag TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+        finally:
+            conn.close()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache_entry WHERE key = ? AND expires >= ?', (key, time.time())).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value, timeout):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO cache_entry (key, value, expires) VALUES (?, ?, ?)',
+                     (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + timeout))
+        self._sets += 1
+        if self._sets % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM cache_entry WHERE expires < ?', (time.time(),))
+
+    def version(self, tag):
+        row = self._connection().execute('SELECT version FROM cache_version WHERE tag = ?', (tag,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, tag):
+        self._connection().execute(
+            'INSERT INTO cache_version (tag, version) VALUES (?, 1) '
+            'ON CONFLICT (tag) DO UPDATE SET version = version + 1', (tag,))
+
+
+def make_backend(app):
+    config = app.config
+    kind = config.get('CACHE_TYPE', 'lru')
+    if kind == 'null':
+        return NullBackend()
+    if kind == 'sqlite':
+        path = config.get('CACHE_SQLITE_PATH') or os.path.join(app.instance_path, 'cache.db')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return SQLiteBackend(path)
+    return LRUBackend(config.get('CACHE_MAXSIZE', 1024))
+
+
+class ResponseCache:
+    """Whole-response cache for public pages, invalidated by tag.
+
+    Every cached entry is keyed on the current version of the tags it
+    depends on; a committed write to a tagged model bumps the version, so
+    stale entries are simply never read again and age out.
+    """
+
+    def __init__(self, backend=None, timeout=300):
+        self.backend = backend or NullBackend()
+        self.timeout = timeout
+        self.hits = {}
+        self.misses = {}
+
+    def init_app(self, app):
+        self.backend = make_backend(app)
+        self.timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+
+    def _key(self, tags):
+        versions = ','.join('%s=%d' % (tag, self.backend.version(tag)) for tag in tags)
+        # views behind versioning.conditional() also key on the database
+        # version, so a cached body always matches the ETag sent with it
+        return 'view:%s:%s:%s' % (versions, g.get('etag', ''), request.full_path)
+
+    def cached(self, *tags, timeout=None):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or '_flashes' in session:
+                    # pending flash messages are rendered into the page
+                    return view(*args, **kwargs)
+                key = self._key(tags)
+                hit = self.backend.get(key)
+                if hit is not None:
+                    self.hits[request.endpoint] = self.hits.get(request.endpoint, 0) + 1
+                    body, status, mimetype = hit
+                    response = current_app.response_class(body, status=status, mimetype=mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+                self.misses[request.endpoint] = self.misses.get(request.endpoint, 0) + 1
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    self.backend.set(key, (response.get_data(), response.status_code, response.mimetype),
+                                     timeout or self.timeout)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.bump(tag)
+
+    def stats(self):
+        return {endpoint: {'hits': self.hits.get(endpoint, 0), 'misses': self.misses.get(endpoint, 0)}
+                for endpoint in set(self.hits) | set(self.misses)}
+
+
+cache = ResponseCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_tags(session, flush_context):
+    tags = session.info.setdefault('cache_tags', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tag = MODEL_TAGS.get(type(obj))
+        if tag:
+            tags.add(tag)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    # Only after commit: invalidating at flush time would let a concurrent
+    # reader cache the pre-commit rows again.
+    tags = session.info.pop('cache_tags', None)
+    if tags:
+        cache.invalidate(*tags)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_tags(session, previous_transaction):
+    session.info.pop('cache_tags', None)
@@ -0,0 +1,96 @@
+import os
+import weakref
+from functools import wraps
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Bind name of the optional read replica (DATABASE_READ_URL).
+READER = 'reader'
+
+
+def engine_options(uri, config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the database at uri.
+
+    SQLite is tuned per connection in configure_engine(); a server database
+    gets a sized pool that checks connections before handing them out, so a
+    restarted or failed-over server doesn't surface as a request error.
+    """
+    if make_url(uri).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+
+# Every engine configured in this process, whichever app it belongs to.
+_engines = weakref.WeakSet()
+
+
+def _after_fork():
+    # a forked worker must not reuse connections the parent opened
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def configure_engine(engine, config):
+    _engines.add(engine)
+    if engine.dialect.name == 'sqlite':
+        _configure_sqlite(engine, config)
+
+
+def _configure_sqlite(engine, config):
+    # pysqlite issues its own deferred BEGIN lazily before the first write,
+    # which leaves us no way to ask for BEGIN IMMEDIATE. Take transaction
+    # control away from the driver and emit BEGIN ourselves instead, so a
+    # connection can opt into an immediate write transaction with
+    # execution_options(sqlite_begin='IMMEDIATE').
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout=%d' % config['SQLITE_BUSY_TIMEOUT'])
+        cursor.execute('PRAGMA mmap_size=%d' % config['SQLITE_MMAP_SIZE'])
+        # negative: size in KiB rather than pages
+        cursor.execute('PRAGMA cache_size=%d' % config['SQLITE_CACHE_SIZE'])
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(conn):
+        mode = conn.get_execution_options().get('sqlite_begin', 'DEFERRED')
+        conn.exec_driver_sql('BEGIN ' + mode)
+
+
+class RoutingSession(Session):
+    """Sends the queries of read_only() views to the reader bind, if there is one.
+
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_app_context() and g.get('db_read_only')
+                and READER in self._db.engines and not getattr(clause, 'is_dml', False)):
+            return self._db.engines[READER]
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Run view against the read replica when DATABASE_READ_URL is set."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.db_read_only = False
+    return wrapper
@@ -0,0 +1,161 @@
+import csv
+import io
+import json
+import click
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from flaskshow import db
+from flaskshow.bulk import FORMATS
+from flaskshow.models import Event, EventSales, Ticket, Venue
+
+# Rows fetched from the cursor at a time, and bytes buffered before a chunk
+# is handed to the server. Neither grows with the size of the export.
+YIELD_PER = 1000
+CHUNK_SIZE = 64 * 1024
+MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+class InvalidExport(ValueError):
+    pass
+
+
+def _tickets():
+    return (select(Ticket.id, Ticket.event_id, Event.name.label('event_name'),
+                   Event.start_time, Event.venue_id, Venue.name.label('venue_name'),
+                   Ticket.buyer_id, Ticket.quantity, Ticket.price,
+                   (Ticket.quantity * Ticket.price).label('total'))
+            .select_from(Ticket)
+            .join(Event, Event.id == Ticket.event_id)
+            .outerjoin(Venue, Venue.id == Event.venue_id)
+            .order_by(Ticket.id))
+
+
+def _events():
+    return (select(Event.id, Event.name, Event.start_time, Event.end_time,
+                   Event.venue_id, Venue.name.label('venue_name'), Event.ticket_price,
+                   func.coalesce(EventSales.tickets_sold, 0).label('tickets_sold'),
+                   func.coalesce(EventSales.revenue, 0).label('revenue'))
+            .select_from(Event)
+            .outerjoin(Venue, Venue.id == Event.venue_id)
+            .outerjoin(EventSales, EventSales.event_id == Event.id)
+            .order_by(Event.id))
+
+
+KINDS = {'tickets': _tickets, 'events': _events}
+
+
+def _parse_date(name, raw):
+    try:
+        return datetime.fromisoformat(raw.strip())
+    except ValueError:
+        raise InvalidExport('%s must be an ISO date or datetime' % name)
+
+
+def _parse_id(name, raw):
+    try:
+        return int(raw)
+    except ValueError:
+        raise InvalidExport('%s must be an integer' % name)
+
+
+def parse_filters(args):
+    """Filters from a query string or CLI options: from, to, venue_id, event_id.
+
+    from and to bound the event start time; tickets carry no date of their own.
+    """
+    filters = {}
+    for name in ('from', 'to'):
+        if args.get(name):
+            filters[name] = _parse_date(name, args[name])
+    for name in ('venue_id', 'event_id'):
+        if args.get(name):
+            filters[name] = _parse_id(name, str(args[name]))
+    return filters
+
+
+def query(kind, filters):
+    stmt = KINDS[kind]()
+    if 'from' in filters:
+        stmt = stmt.where(Event.start_time >= filters['from'])
+    if 'to' in filters:
+        stmt = stmt.where(Event.start_time < filters['to'])
+    if 'venue_id' in filters:
+        stmt = stmt.where(Event.venue_id == filters['venue_id'])
+    if 'event_id' in filters:
+        stmt = stmt.where(Event.id == filters['event_id'])
+    return stmt
+
+
+def open_rows(kind, filters):
+    """Execute the export query and return its result, unbuffered.
+
+    yield_per asks for a server-side cursor where the driver has one and
+    fetches YIELD_PER rows at a time, so only one batch is ever in memory.
+    """
+    return db.session.execute(query(kind, filters), execution_options={'yield_per': YIELD_PER})
+
+
+def _value(value):
+    return value.isoformat(sep=' ') if isinstance(value, datetime) else value
+
+
+def _lines(result, fmt):
+    columns = list(result.keys())
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        for row in result:
+            writer.writerow([_value(value) for value in row])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        return
+    for row in result:
+        yield json.dumps(dict(zip(columns, map(_value, row)))) + '\n'
+
+
+def generate(result, fmt):
+    """Serialize result as fmt text, in chunks of about CHUNK_SIZE.
+
+    The first chunk (the CSV header, or the first NDJSON row) is yielded on
+    its own so a client sees bytes before the rest of the query runs.
+    """
+    try:
+        chunk, size, first = [], 0, True
+        for line in _lines(result, fmt):
+            chunk.append(line)
+            size += len(line)
+            if first or size >= CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk, size, first = [], 0, False
+        if chunk:
+            yield ''.join(chunk)
+    finally:
+        result.close()
+
+
+@click.command('export-data')
+@with_appcontext
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('output', type=click.File('w', encoding='utf-8', lazy=True), default='-')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='ndjson')
+@click.option('--from', 'start', help='events starting on or after this date')
+@click.option('--to', 'end', help='events starting before this date')
+@click.option('--venue-id', type=int)
+@click.option('--event-id', type=int)
+def export_data_command(kind, output, fmt, start, end, venue_id, event_id):
+    """Stream tickets or events out as CSV or NDJSON."""
+    try:
+        filters = parse_filters({'from': start, 'to': end, 'venue_id': venue_id, 'event_id': event_id})
+    except InvalidExport as error:
+        raise click.UsageError(str(error))
+    for chunk in generate(open_rows(kind, filters), fmt):
+        output.write(chunk)
+
+
+COMMANDS = (export_data_command,)
@@ -1,9 +1,10 @@
 from flask import Flask, render_template, redirect, url_for
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, BooleanField,SelectField,IntegerField,DateField, FileField,DecimalField
-from wtforms.validators import DataRequired, Length, Email, EqualTo, InputRequired, NumberRange
+from wtforms.validators import DataRequired, Length, Email, EqualTo, InputRequired, NumberRange, ValidationError
 from flask_wtf.file import FileField, FileAllowed
 from flask_wtf.csrf import CSRFProtect
+from flaskshow.models import Buyer
 
 
 
@@ -16,6 +17,11 @@ class BuyerRegistrationForm(FlaskForm):
     confirm_password = PasswordField('Confirm Password', validators=[DataRequired(), EqualTo('password')])
     submit = SubmitField('Sign Up')
 
+    def validate_email(self, email):
+        # buyer.email is unique; say so here rather than fail the insert
+        if Buyer.query.filter_by(email=email.data).first():
+            raise ValidationError('That email is already registered.')
+
 
 class AdminRegistrationForm(FlaskForm):
     id = IntegerField('ID', validators=[DataRequired(), NumberRange(min=1, message="Please enter a valid ID.")])
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from flaskshow import db, login_manager
+from flaskshow.models import Admin, Buyer
+
+# Session ids are "<kind>:<id>" (see Buyer.get_id / Admin.get_id), so a
+# buyer and an admin that share a primary key can never be confused.
+KINDS = {'buyer': Buyer, 'admin': Admin}
+COLUMNS = {
+    'buyer': (Buyer.id, Buyer.name, Buyer.email),
+    'admin': (Admin.id, Admin.username, Admin.email, Admin.venue_id),
+}
+
+_principals = OrderedDict()  # (kind, id) -> (principal, expires), least recently used first
+_lock = threading.Lock()
+
+
+class Principal(UserMixin):
+    """What a request needs to know about who is signed in, without a session.
+
+    A plain object, safe to share between requests and threads.
+    """
+
+    def __init__(self, kind, id, name, email, venue_id=None):
+        self.kind = kind
+        self.id = id
+        self.name = name
+        self.email = email
+        self.venue_id = venue_id
+
+    def get_id(self):
+        return '%s:%d' % (self.kind, self.id)
+
+    def is_buyer(self):
+        return self.kind == 'buyer'
+
+    def is_admin(self):
+        return self.kind == 'admin'
+
+
+def _load(kind, id):
+    row = db.session.execute(select(*COLUMNS[kind]).where(KINDS[kind].id == id)).first()
+    return Principal(kind, *row) if row else None
+
+
+@login_manager.user_loader
+def load_principal(user_id):
+    """Resolve a session id to a Principal, from memory when possible.
+
+    Flask-Login keeps the result for the rest of the request, so a request
+    costs at most one lookup here and none once the cache is warm.
+    """
+    kind, _, raw = user_id.partition(':')
+    if kind not in KINDS or not raw.isdigit():
+        return None  # ids from before the "<kind>:" prefix sign the user out
+    key = (kind, int(raw))
+    with _lock:
+        entry = _principals.get(key)
+        if entry and entry[1] > time.monotonic():
+            _principals.move_to_end(key)
+            return entry[0]
+    principal = _load(*key)
+    if principal is not None:
+        with _lock:
+            _principals[key] = (principal, time.monotonic() + current_app.config['IDENTITY_TTL'])
+            _principals.move_to_end(key)
+            # one entry per signed-in account; the least recently seen go first
+            while len(_principals) > current_app.config['IDENTITY_CACHE_SIZE']:
+                _principals.popitem(last=False)
+    return principal
+
+
+def invalidate(kind, id):
+    with _lock:
+        _principals.pop((kind, id), None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed(session, flush_context):
+    changed = session.info.setdefault('identity_changed', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        for kind, model in KINDS.items():
+            if isinstance(obj, model):
+                changed.add((kind, obj.id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    # Other workers keep their copy until IDENTITY_TTL runs out.
+    for key in session.info.pop('identity_changed', ()):
+        invalidate(*key)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changed(session, previous_transaction):
+    session.info.pop('identity_changed', None)
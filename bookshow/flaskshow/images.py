@@ -0,0 +1,167 @@
+import click
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, update
+from flaskshow import db
+from flaskshow.cache import cache
+from flaskshow.models import Event
+from flaskshow.versioning import bump
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'event_images')
+
+# Renditions made for every uploaded image: thumbnails for lists, cards for
+# the dashboards and a large hero image. thumbnail() keeps the aspect ratio
+# and never upscales.
+VARIANTS = (
+    ('thumb', (160, 160)),
+    ('card', (500, 500)),
+    ('hero', (1600, 900)),
+)
+VARIANT_FORMAT = 'WEBP'
+VARIANT_EXT = '.webp'
+VARIANT_QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def variant_name(image, variant):
+    return '%s-%s%s' % (os.path.splitext(image)[0], variant, VARIANT_EXT)
+
+
+def _write_atomic(path, data):
+    # Write next to the target and rename, so readers never see half a file
+    # and two uploads of the same image can race safely.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def store_original(file_storage):
+    """Store an upload under its content hash and return the file name.
+
+    Only the header is parsed here; the image is decoded and resized later
+    by render(). Uploading the same picture twice stores it once.
+    """
+    from PIL import Image, UnidentifiedImageError  # only needed on upload; slow to import
+    data = file_storage.read()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+            fmt = image.format
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise InvalidImage('not a valid image')
+    ext = '.jpg' if fmt == 'JPEG' else '.' + fmt.lower()
+    name = hashlib.sha256(data).hexdigest()[:16] + ext
+    path = os.path.join(IMAGE_DIR, name)
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    return name
+
+
+def available(image):
+    """Comma-separated list of the renditions already on disk for image."""
+    return ','.join(variant for variant, _ in VARIANTS
+                    if os.path.exists(os.path.join(IMAGE_DIR, variant_name(image, variant))))
+
+
+def complete(variants):
+    return set((variants or '').split(',')) >= {variant for variant, _ in VARIANTS}
+
+
+def render(image_dir, image):
+    """Write every missing rendition of image; returns the image name.
+
+    A plain function of its arguments so it can run in a worker process.
+    """
+    from PIL import Image, ImageOps
+    with Image.open(os.path.join(image_dir, image)) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            transparent = original.mode in ('LA', 'PA') or 'transparency' in original.info
+            original = original.convert('RGBA' if transparent else 'RGB')
+        for variant, size in VARIANTS:
+            path = os.path.join(image_dir, variant_name(image, variant))
+            if os.path.exists(path):
+                continue
+            copy = original.copy()
+            copy.thumbnail(size, Image.LANCZOS)
+            out = io.BytesIO()
+            copy.save(out, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+            _write_atomic(path, out.getvalue())
+    return image
+
+
+def record_variants(image):
+    """Point every event using image at the renditions now on disk."""
+    variants = available(image)
+    with db.engine.begin() as connection:
+        result = connection.execute(
+            update(Event).where(Event.image == image).values(image_variants=variants))
+        if result.rowcount:
+            # a Core update skips the session hooks
+            bump(connection, 'event')
+    if result.rowcount:
+        cache.invalidate('events')
+
+
+def _done(app, future):
+    # runs on the pool's thread, outside the request that started the render
+    with app.app_context():
+        try:
+            record_variants(future.result())
+        except Exception:
+            current_app.logger.exception('rendering event image failed')
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = current_app.config.get('IMAGE_WORKERS', 2)
+            if current_app.config.get('IMAGE_POOL') == 'process':
+                _executor = ProcessPoolExecutor(max_workers=workers)
+            else:
+                # Pillow drops the GIL while resizing and encoding
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+        return _executor
+
+
+def render_async(image):
+    """Render image's renditions in the background and record them when done."""
+    app = current_app._get_current_object()
+    future = _pool().submit(render, IMAGE_DIR, image)
+    future.add_done_callback(lambda done: _done(app, done))
+    return future
+
+
+@click.command('images-render')
+@with_appcontext
+def images_render_command():
+    """Render missing renditions for every event image."""
+    images = db.session.scalars(select(Event.image).where(Event.image.isnot(None)).distinct()).all()
+    for image in images:
+        if os.path.exists(os.path.join(IMAGE_DIR, image)):
+            record_variants(render(IMAGE_DIR, image))
+    print('Rendered %d images.' % len(images))
+
+
+COMMANDS = (images_render_command,)
@@ -0,0 +1,361 @@
+import click
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from flaskshow import db, sales
+from flaskshow.models import Event, SeatHold, SeatInventory, Ticket, Venue
+
+
+class SoldOut(Exception):
+    pass
+
+
+def _check_quantity(quantity):
+    # a negative quantity would put seats back on the counter
+    if quantity < 1:
+        raise ValueError('quantity must be at least 1, not %r' % (quantity,))
+
+
+@contextmanager
+def write_transaction():
+    """Run the block in a transaction that takes the write lock up front.
+
+    On SQLite this is BEGIN IMMEDIATE, so concurrent buyers queue on
+    busy_timeout instead of failing with "database is locked" when a read
+    transaction tries to upgrade to a write.
+    """
+    # finish any read transaction the request opened before we start writing
+    db.session.commit()
+    db.session.connection(execution_options={'sqlite_begin': 'IMMEDIATE'})
+    try:
+        yield
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _insert_ignore(model):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return sqlite.insert(model).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        return postgresql.insert(model).on_conflict_do_nothing()
+    return insert(model).prefix_with('IGNORE')
+
+
+def _capacity(event_id):
+    return (select(func.coalesce(Venue.capacity, 0))
+            .select_from(Event)
+            .outerjoin(Venue, Event.venue_id == Venue.id)
+            .where(Event.id == event_id)
+            .scalar_subquery())
+
+
+def _sold(event_id):
+    return (select(func.coalesce(func.sum(Ticket.quantity), 0))
+            .where(Ticket.event_id == event_id)
+            .scalar_subquery())
+
+
+def ensure_inventory(event_id):
+    """Create the seat counter for an event if it does not exist yet.
+
+    The counter starts at the venue capacity minus whatever was sold before
+    the event had a counter.
+    """
+    capacity = func.coalesce(Venue.capacity, 0)
+    rows = (select(Event.id, capacity, capacity - _sold(event_id))
+            .select_from(Event)
+            .outerjoin(Venue, Event.venue_id == Venue.id)
+            .where(Event.id == event_id))
+    db.session.execute(_insert_ignore(SeatInventory).from_select(['event_id', 'capacity', 'remaining'], rows))
+
+
+def ensure_inventories(event_ids):
+    """ensure_inventory() for many events in one statement."""
+    sold = (select(Ticket.event_id, func.sum(Ticket.quantity).label('sold'))
+            .where(Ticket.event_id.in_(event_ids))
+            .group_by(Ticket.event_id)
+            .subquery())
+    capacity = func.coalesce(Venue.capacity, 0)
+    rows = (select(Event.id, capacity, capacity - func.coalesce(sold.c.sold, 0))
+            .select_from(Event)
+            .outerjoin(Venue, Event.venue_id == Venue.id)
+            .outerjoin(sold, sold.c.event_id == Event.id)
+            .where(Event.id.in_(event_ids)))
+    db.session.execute(_insert_ignore(SeatInventory).from_select(['event_id', 'capacity', 'remaining'], rows))
+
+
+def _take(event_id, quantity):
+    _check_quantity(quantity)
+    result = db.session.execute(
+        update(SeatInventory)
+        .where(SeatInventory.event_id == event_id, SeatInventory.remaining >= quantity)
+        .values(remaining=SeatInventory.remaining - quantity),
+        execution_options={'synchronize_session': False})
+    return result.rowcount == 1
+
+
+def take_seats(event_id, quantity):
+    """Decrement the event's counter by quantity, or raise SoldOut.
+
+    Must run inside write_transaction(); the conditional UPDATE is the only
+    statement on the hot path.
+    """
+    _check_quantity(quantity)
+    if _take(event_id, quantity):
+        return
+    ensure_inventory(event_id)
+    if not _take(event_id, quantity):
+        raise SoldOut(event_id)
+
+
+def allocate(requests):
+    """Take seats for many (event_id, quantity) requests in a few statements.
+
+    Must run inside write_transaction(). Requests are granted in order while
+    an event has seats left; returns one boolean per request.
+    """
+    for _, quantity in requests:
+        _check_quantity(quantity)
+    event_ids = sorted({event_id for event_id, _ in requests})
+    ensure_inventories(event_ids)
+    remaining = dict(db.session.execute(
+        select(SeatInventory.event_id, SeatInventory.remaining)
+        .where(SeatInventory.event_id.in_(event_ids))
+        .with_for_update()).all())
+    granted = []
+    for event_id, quantity in requests:
+        ok = remaining.get(event_id, 0) >= quantity
+        if ok:
+            remaining[event_id] -= quantity
+        granted.append(ok)
+    # the rows are locked (FOR UPDATE, or BEGIN IMMEDIATE on SQLite), so
+    # writing back the computed counts cannot lose a concurrent sale
+    changed = {event_id for (event_id, _), ok in zip(requests, granted) if ok}
+    if changed:
+        db.session.execute(update(SeatInventory),
+                           [{'event_id': event_id, 'remaining': remaining[event_id]} for event_id in changed])
+    return granted
+
+
+def release_seats(event_id, quantity):
+    db.session.execute(
+        update(SeatInventory)
+        .where(SeatInventory.event_id == event_id)
+        .values(remaining=SeatInventory.remaining + quantity),
+        execution_options={'synchronize_session': False})
+
+
+def _release_holds(holds):
+    """Delete the given (id, event_id, quantity) holds and give their seats back."""
+    if not holds:
+        return
+    db.session.execute(delete(SeatHold).where(SeatHold.id.in_([h.id for h in holds])),
+                       execution_options={'synchronize_session': False})
+    released = {}
+    for hold in holds:
+        released[hold.event_id] = released.get(hold.event_id, 0) + hold.quantity
+    for event_id, quantity in released.items():
+        release_seats(event_id, quantity)
+
+
+def _expired_holds(now, event_ids=None):
+    query = (select(SeatHold.id, SeatHold.event_id, SeatHold.quantity)
+             .where(SeatHold.expires_at <= now)
+             .with_for_update(skip_locked=True))
+    if event_ids is not None:
+        query = query.where(SeatHold.event_id.in_(event_ids))
+    return db.session.execute(query).all()
+
+
+def sweep_expired_holds(now=None):
+    """Return the seats of every expired hold to the counters.
+
+    Only touches expired rows, found through the expires_at index.
+    """
+    now = now or datetime.utcnow()
+    with write_transaction():
+        holds = _expired_holds(now)
+        _release_holds(holds)
+    return len(holds)
+
+
+def hold_seats(event_id, buyer_id, quantity):
+    """Reserve seats for a buyer for SEAT_HOLD_SECONDS.
+
+    Replaces any hold the buyer already has on the event, so reloading the
+    checkout page does not stack holds.
+    """
+    _check_quantity(quantity)
+    now = datetime.utcnow()
+    with write_transaction():
+        _release_holds(_expired_holds(now, [event_id]))
+        previous = db.session.execute(
+            select(SeatHold.id, SeatHold.event_id, SeatHold.quantity)
+            .where(SeatHold.buyer_id == buyer_id, SeatHold.event_id == event_id)).all()
+        _release_holds(previous)
+        take_seats(event_id, quantity)
+        hold = SeatHold(event_id=event_id, buyer_id=buyer_id, quantity=quantity,
+                        expires_at=now + timedelta(seconds=current_app.config['SEAT_HOLD_SECONDS']))
+        db.session.add(hold)
+    return hold
+
+
+def _claim_hold(event_id, buyer_id, now):
+    """Delete the buyer's live hold on the event and return its quantity (0 if none)."""
+    held = db.session.execute(
+        select(SeatHold.id, SeatHold.quantity)
+        .where(SeatHold.buyer_id == buyer_id, SeatHold.event_id == event_id,
+               SeatHold.expires_at > now)).first()
+    if held is None:
+        return 0
+    result = db.session.execute(
+        delete(SeatHold).where(SeatHold.id == held.id, SeatHold.expires_at > now),
+        execution_options={'synchronize_session': False})
+    return held.quantity if result.rowcount == 1 else 0
+
+
+def purchase(event, buyer_id, quantity):
+    """Sell quantity seats to the buyer, converting their hold if they have one.
+
+    Seats already held are not taken from the counter a second time; only
+    the difference between the hold and the purchased quantity is.
+    """
+    _check_quantity(quantity)
+    event_id, price = event.id, event.ticket_price
+    now = datetime.utcnow()
+    with write_transaction():
+        # lapsed holds count as free seats (see seats_remaining), the
+        # buyer's own included, so put them back before taking any
+        _release_holds(_expired_holds(now, [event_id]))
+        held = _claim_hold(event_id, buyer_id, now) if buyer_id is not None else 0
+        if quantity > held:
+            take_seats(event_id, quantity - held)
+        elif quantity < held:
+            release_seats(event_id, held - quantity)
+        ticket = Ticket(event_id=event_id, price=price, quantity=quantity, buyer_id=buyer_id)
+        db.session.add(ticket)
+    return ticket
+
+
+def _claim_holds(buyer_id, event_ids, now):
+    """Delete the buyer's live holds on the events; returns {event_id: quantity held}."""
+    rows = db.session.execute(
+        delete(SeatHold)
+        .where(SeatHold.buyer_id == buyer_id, SeatHold.event_id.in_(event_ids), SeatHold.expires_at > now)
+        .returning(SeatHold.event_id, SeatHold.quantity),
+        execution_options={'synchronize_session': False}).all()
+    held = {}
+    for event_id, quantity in rows:
+        held[event_id] = held.get(event_id, 0) + quantity
+    return held
+
+
+def checkout(buyer_id, lines, prices):
+    """Sell every (event_id, quantity) line to the buyer in one transaction, or none.
+
+    prices maps each event_id to the price charged per ticket. Holds are
+    converted as in purchase(). Raises SoldOut with the ids of the events
+    that could not be filled; nothing is sold in that case.
+    """
+    quantities = {}
+    for event_id, quantity in lines:
+        _check_quantity(quantity)
+        quantities[event_id] = quantities.get(event_id, 0) + quantity
+    now = datetime.utcnow()
+    with write_transaction():
+        _release_holds(_expired_holds(now, list(quantities)))
+        held = _claim_holds(buyer_id, list(quantities), now) if buyer_id is not None else {}
+        needed = [(event_id, quantity - held.get(event_id, 0))
+                  for event_id, quantity in quantities.items() if quantity > held.get(event_id, 0)]
+        if needed:
+            granted = allocate(needed)
+            short = [event_id for (event_id, _), ok in zip(needed, granted) if not ok]
+            if short:
+                raise SoldOut(*short)
+        for event_id, quantity in quantities.items():
+            if held.get(event_id, 0) > quantity:
+                release_seats(event_id, held[event_id] - quantity)
+        tickets = db.session.execute(
+            insert(Ticket).returning(Ticket.id, Ticket.event_id, Ticket.quantity, Ticket.price),
+            [{'event_id': event_id, 'quantity': quantity, 'price': prices[event_id], 'buyer_id': buyer_id}
+             for event_id, quantity in quantities.items()]).all()
+        # a Core insert; the session's after_flush hook never sees these rows
+        sales.record_tickets(db.session.connection(),
+                             [(ticket.event_id, ticket.quantity, ticket.price) for ticket in tickets])
+    return tickets
+
+
+def seats_remaining(event_id):
+    """Seats still on sale, net of live holds.
+
+    Holds take their seats from the counter up front, so only holds that
+    have expired but not been swept yet need adding back.
+    """
+    remaining = db.session.execute(
+        select(SeatInventory.remaining).where(SeatInventory.event_id == event_id)).scalar()
+    if remaining is None:
+        remaining = db.session.execute(select(_capacity(event_id) - _sold(event_id))).scalar()
+    lapsed = db.session.execute(
+        select(func.coalesce(func.sum(SeatHold.quantity), 0))
+        .where(SeatHold.expires_at <= datetime.utcnow(), SeatHold.event_id == event_id)).scalar()
+    return max((remaining or 0) + lapsed, 0)
+
+
+def held_seats(event_id, buyer_id=None):
+    """Seats in live holds on the event, or in one buyer's live hold."""
+    query = (select(func.coalesce(func.sum(SeatHold.quantity), 0))
+             .where(SeatHold.event_id == event_id, SeatHold.expires_at > datetime.utcnow()))
+    if buyer_id is not None:
+        query = query.where(SeatHold.buyer_id == buyer_id)
+    return db.session.execute(query).scalar()
+
+
+def resize(event_ids):
+    """Carry venue capacity changes over to the counters of the given events.
+
+    event_ids may be a list or a select of event ids.
+    """
+    capacity = _capacity(SeatInventory.event_id)
+    db.session.execute(
+        update(SeatInventory)
+        .where(SeatInventory.event_id.in_(event_ids))
+        .values(remaining=SeatInventory.remaining + capacity - SeatInventory.capacity,
+                capacity=capacity),
+        execution_options={'synchronize_session': False})
+
+
+def resize_venue(venue_id):
+    resize(select(Event.id).where(Event.venue_id == venue_id))
+
+
+def move_event(event, venue_id):
+    """Move the event to another venue and its counter to that venue's capacity.
+
+    Must run inside write_transaction(). Raises ValueError if more seats
+    have been sold than the new venue holds.
+    """
+    if venue_id == event.venue_id:
+        return
+    capacity = db.session.execute(select(Venue.capacity).where(Venue.id == venue_id)).scalar() or 0
+    sold = db.session.execute(select(_sold(event.id))).scalar()
+    if sold > capacity:
+        raise ValueError('%d seats are already sold, more than the %d that venue holds.' % (sold, capacity))
+    event.venue_id = venue_id
+    db.session.flush()
+    resize([event.id])
+
+
+@click.command('sweep-holds')
+@with_appcontext
+def sweep_holds_command():
+    """Release expired seat holds."""
+    print('Released %d expired holds.' % sweep_expired_holds())
+
+
+COMMANDS = (sweep_holds_command,)
@@ -0,0 +1,254 @@
+import glob
+import hmac
+import ipaddress
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app, g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from flaskshow.cache import cache
+from flaskshow.querycount import is_query
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RENDER_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'flaskshow_http_requests_total': ('counter', 'Requests handled.', None),
+    'flaskshow_http_request_duration_seconds': (
+        'histogram', 'Time to produce a response; a streamed body is not included.', LATENCY_BUCKETS),
+    'flaskshow_http_response_size_bytes': (
+        'histogram', 'Response body size, for responses whose length is known up front.', SIZE_BUCKETS),
+    'flaskshow_db_statements_per_request': ('histogram', 'SQL statements executed per request.', STATEMENT_BUCKETS),
+    'flaskshow_db_seconds_per_request': ('histogram', 'Time spent in SQL per request.', LATENCY_BUCKETS),
+    'flaskshow_template_render_seconds': ('histogram', 'Jinja template render time.', RENDER_BUCKETS),
+    'flaskshow_cache_requests_total': ('counter', 'Response cache lookups by result.', None),
+    'flaskshow_rate_limited_total': ('counter', 'Requests turned away by the rate limiter.', None),
+}
+
+# Every thread counts into a dict only it writes to, so recording takes no
+# lock; scraping copies and sums them. A histogram is a list of bucket
+# counts (the last one +Inf) followed by the sum and the count.
+_local = threading.local()
+_stores = []
+_retired = {}
+_stores_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_next_flush = 0
+
+
+def _store():
+    store = getattr(_local, 'store', None)
+    if store is None:
+        store = _local.store = {}
+        with _stores_lock:
+            _stores.append((threading.current_thread(), store))
+    return store
+
+
+def inc(name, labels, value=1):
+    store = _store()
+    key = (name, labels)
+    store[key] = store.get(key, 0) + value
+
+
+def observe(name, labels, value):
+    buckets = METRICS[name][2]
+    store = _store()
+    histogram = store.get((name, labels))
+    if histogram is None:
+        histogram = store[(name, labels)] = [0] * (len(buckets) + 3)
+    histogram[bisect_left(buckets, value)] += 1
+    histogram[-2] += value
+    histogram[-1] += 1
+
+
+def _merge(into, entries):
+    for key, value in entries:
+        if isinstance(value, list):
+            current = into.get(key)
+            into[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+def _copy(store):
+    # dict.copy() and list() each run without releasing the GIL, so the
+    # owning thread can keep counting while we read
+    return [(key, list(value) if isinstance(value, list) else value) for key, value in store.copy().items()]
+
+
+def snapshot():
+    """Totals of this worker: every thread's counters plus the cache's."""
+    totals = {}
+    with _stores_lock:
+        live = []
+        for thread, store in _stores:
+            if thread.is_alive():
+                live.append((thread, store))
+                _merge(totals, _copy(store))
+            else:
+                # finished threads (e.g. the dev server's) are folded away
+                _merge(_retired, _copy(store))
+        _stores[:] = live
+        _merge(totals, _retired.items())
+    for endpoint, counts in cache.stats().items():
+        for stat, result in (('hits', 'hit'), ('misses', 'miss')):
+            key = ('flaskshow_cache_requests_total', (('endpoint', endpoint), ('result', result)))
+            _merge(totals, [(key, counts[stat])])
+    return totals
+
+
+def _worker_file(pid):
+    return os.path.join(current_app.config['METRICS_DIR'], 'worker-%d.json' % pid)
+
+
+def flush():
+    """Write this worker's totals to METRICS_DIR for the other workers' scrapes."""
+    os.makedirs(current_app.config['METRICS_DIR'], exist_ok=True)
+    path = _worker_file(os.getpid())
+    entries = [[name, [list(pair) for pair in labels], value] for (name, labels), value in snapshot().items()]
+    with open(path + '.tmp', 'w') as f:
+        json.dump(entries, f)
+    os.replace(path + '.tmp', path)
+
+
+def collect():
+    """Totals across workers: this one's live counters, the others' last flush."""
+    totals = snapshot()
+    if current_app.config.get('METRICS_DIR'):
+        own = _worker_file(os.getpid())
+        for path in glob.glob(os.path.join(current_app.config['METRICS_DIR'], 'worker-*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                continue  # a worker mid-write; its next flush will be read
+            _merge(totals, (((name, tuple(tuple(pair) for pair in labels)), value)
+                            for name, labels, value in entries))
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs) if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(totals=None):
+    """The totals in the Prometheus text exposition format."""
+    totals = collect() if totals is None else totals
+    by_name = {}
+    for (name, labels), value in totals.items():
+        by_name.setdefault(name, []).append((labels, value))
+    lines = []
+    for name, (kind, help, buckets) in METRICS.items():
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for labels, value in sorted(by_name.get(name, ())):
+            if kind != 'histogram':
+                lines.append('%s%s %s' % (name, _labels(labels), _number(value)))
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), value):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (name, _labels(labels + (('le', bound),)), cumulative))
+            lines.append('%s_sum%s %s' % (name, _labels(labels), _number(value[-2])))
+            lines.append('%s_count%s %d' % (name, _labels(labels), value[-1]))
+    return '\n'.join(lines) + '\n'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _statement_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('metrics_started', None)
+    if started is None or not has_request_context() or 'metrics_sql' not in g or not is_query(statement):
+        return
+    g.metrics_sql[0] += 1
+    g.metrics_sql[1] += time.perf_counter() - started
+
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        if not current_app.config['METRICS_ENABLED']:
+            return super().render(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            observe('flaskshow_template_render_seconds', (('template', self.name or ''),),
+                    time.perf_counter() - started)
+
+
+def _start_request():
+    if current_app.config['METRICS_ENABLED']:
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql = [0, 0.0]
+
+
+def _finish_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    # the endpoint, never the path, so label values stay bounded
+    endpoint = request.endpoint or 'unmatched'
+    labels = (('endpoint', endpoint),)
+    inc('flaskshow_http_requests_total',
+        (('endpoint', endpoint), ('method', request.method), ('status', str(response.status_code))))
+    observe('flaskshow_http_request_duration_seconds', labels, time.perf_counter() - started)
+    if response.content_length is not None:
+        observe('flaskshow_http_response_size_bytes', labels, response.content_length)
+    statements, seconds = g.pop('metrics_sql')
+    observe('flaskshow_db_statements_per_request', labels, statements)
+    observe('flaskshow_db_seconds_per_request', labels, seconds)
+    _maybe_flush()
+    return response
+
+
+def scrape_allowed():
+    """Whether this request may read /metrics: a matching bearer token or an allowed address."""
+    token = current_app.config['METRICS_TOKEN']
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token):
+        return True
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network.strip(), strict=False)
+               for network in current_app.config['METRICS_ALLOW'].split(',') if network.strip())
+
+
+def init_app(app):
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def _maybe_flush():
+    global _next_flush
+    if not current_app.config.get('METRICS_DIR') or time.monotonic() < _next_flush:
+        return
+    if _flush_lock.acquire(blocking=False):
+        try:
+            _next_flush = time.monotonic() + current_app.config['METRICS_FLUSH_SECONDS']
+            flush()
+        finally:
+            _flush_lock.release()
@@ -1,39 +1,53 @@
 from datetime import datetime
-from flaskshow import db,app,user_login_manager, admin_login_manager
+from flaskshow import db
 from flask_login import UserMixin
 
-@user_login_manager.user_loader
-def load_user(user_id):
-    return Buyer.query.get(int(user_id))
-
-@admin_login_manager.user_loader
-def load_admin(admin_id):
-    return Admin.query.get(int(admin_id))
-
 
 class Admin(db.Model,UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(20), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(60), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'))
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), index=True)
     events = db.relationship('Event', backref='admin', lazy=True)
 
+    def get_id(self):
+        return 'admin:%d' % self.id
+
     def is_admin(self):
         return True
 
+    def is_buyer(self):
+        return False
+
 
 
 class Event(db.Model,UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False, index=True)
     end_time = db.Column(db.DateTime, nullable=False)
     image = db.Column(db.String(255))
+    image_variants = db.Column(db.String(100))
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=True)
     admin_id = db.Column(db.Integer, db.ForeignKey('admin.id'), nullable=True)
     ticket_price = db.Column(db.Float, nullable=False)
     tickets = db.relationship('Ticket', backref='event', lazy=True)
+    inventory = db.relationship('SeatInventory', uselist=False, cascade='all, delete-orphan', lazy=True)
+    holds = db.relationship('SeatHold', cascade='all, delete-orphan', lazy=True)
+    sales = db.relationship('EventSales', uselist=False, cascade='all, delete-orphan', lazy=True)
+
+    # venue_id alone is served by the leading column; end_time makes the
+    # schedule's clash and calendar lookups index-only
+    __table_args__ = (db.Index('ix_event_venue_schedule', 'venue_id', 'start_time', 'end_time'),)
+
+    def image_path(self, variant=None):
+        """Static path of the event image, or of one of its renditions if it exists yet."""
+        if not self.image:
+            return 'event_images/default.png'
+        if variant and variant in (self.image_variants or '').split(','):
+            return 'event_images/%s-%s.webp' % (self.image.rsplit('.', 1)[0], variant)
+        return 'event_images/' + self.image
 
 
 
@@ -50,16 +64,41 @@ class Venue(db.Model,UserMixin):
 
 class Ticket(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
-    event_id = db.Column(db.Integer, db.ForeignKey('event.id',ondelete='CASCADE'), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id',ondelete='CASCADE'), nullable=False, index=True)
     price = db.Column(db.Float, nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('buyer.id'), index=True)
+
+class SeatInventory(db.Model):
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id', ondelete='CASCADE'), primary_key=True)
+    capacity = db.Column(db.Integer, nullable=False)
+    remaining = db.Column(db.Integer, nullable=False)
+
+class EventSales(db.Model):
+    # running totals kept by flaskshow.sales; rebuilt with flask sales-rebuild
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id', ondelete='CASCADE'), primary_key=True)
+    tickets_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+class SeatHold(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id', ondelete='CASCADE'), nullable=False)
     buyer_id = db.Column(db.Integer, db.ForeignKey('buyer.id'))
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (db.Index('ix_seat_hold_buyer_event', 'buyer_id', 'event_id'),)
+
+class TableVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
 class Buyer(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     password = db.Column(db.String(60), nullable=False)
-    email = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(100), nullable=False, unique=True, index=True)
     phone = db.Column(db.String(20), nullable=False)
     tickets_purchased = db.relationship('Ticket', backref='purchased_by', lazy=True)
 
@@ -67,10 +106,13 @@ class Buyer(db.Model, UserMixin):
 
 
     def get_id(self):
-        return str(self.id)
+        return 'buyer:%d' % self.id
 
     def is_buyer(self):
         return True    
 
+    def is_admin(self):
+        return False
+
     def is_active(self):
         return True
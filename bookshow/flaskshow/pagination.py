@@ -0,0 +1,143 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from sqlalchemy import DateTime, and_, or_, select
+from flaskshow import db
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# what a database integer column holds; a larger bind overflows the driver
+MIN_INT, MAX_INT = -2 ** 63, 2 ** 63 - 1
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def parse_fields(raw, allowed, default):
+    if not raw:
+        return list(default)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise InvalidQuery('unknown fields: %s' % ', '.join(unknown))
+    return fields
+
+
+def parse_limit(raw):
+    if raw is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise InvalidQuery('limit must be an integer')
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def parse_int(raw, name):
+    if raw is None:
+        return None
+    try:
+        value = int(raw)
+    except ValueError:
+        raise InvalidQuery('%s must be an integer' % name)
+    if not MIN_INT <= value <= MAX_INT:
+        raise InvalidQuery('%s is out of range' % name)
+    return value
+
+
+def parse_bool(raw, name):
+    if raw is None:
+        return False
+    value = raw.strip().lower()
+    if value in ('1', 'true', 'yes', 'on'):
+        return True
+    if value in ('', '0', 'false', 'no', 'off'):
+        return False
+    raise InvalidQuery('%s must be true or false' % name)
+
+
+def parse_datetime(raw, name):
+    if raw is None:
+        return None
+    try:
+        return datetime.fromisoformat(raw)
+    except ValueError:
+        raise InvalidQuery('%s must be an ISO 8601 date or datetime' % name)
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_cursor(row, keys):
+    payload = json.dumps([_json_value(row[k]) for k in keys], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _cursor_value(column, value):
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    # exactly the column's type: JSON true would pass for an int otherwise
+    if type(value) is not column.type.python_type:
+        raise ValueError(value)
+    if isinstance(value, int) and not MIN_INT <= value <= MAX_INT:
+        raise ValueError(value)
+    return value
+
+
+def decode_cursor(token, columns):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [_cursor_value(c, v) for c, v in zip(columns, values)]
+    except (ValueError, TypeError, NotImplementedError, binascii.Error):
+        raise InvalidQuery('invalid cursor')
+
+
+def _after(columns, values):
+    # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y), spelled out so the
+    # database can use an index on the ordering columns.
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column > values[i]))
+    return or_(*clauses)
+
+
+def keyset_query(model, fields, order_by, filters=(), cursor=None, limit=DEFAULT_LIMIT):
+    """The select behind keyset_page(), for callers that run it themselves."""
+    table = model.__table__
+    order_columns = [table.c[name] for name in order_by]
+    selected = list(fields) + [name for name in order_by if name not in fields]
+    query = select(*(table.c[name] for name in selected)).where(*filters)
+    if cursor:
+        query = query.where(_after(order_columns, decode_cursor(cursor, order_columns)))
+    query = query.order_by(*order_columns)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return query
+
+
+def keyset_result(rows, fields, order_by, limit=DEFAULT_LIMIT):
+    """(items, next_cursor) from the mappings a keyset_query() returned."""
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], order_by)
+    return [{f: _json_value(row[f]) for f in fields} for row in rows], next_cursor
+
+
+def keyset_page(model, fields, order_by, filters=(), cursor=None, limit=DEFAULT_LIMIT):
+    """Load one page of model rows ordered by order_by, after cursor.
+
+    Only the requested fields (plus the ordering keys) are selected. The last
+    order_by column must be unique. Returns (items, next_cursor); with
+    limit=None every matching row is returned and next_cursor is None.
+    """
+    query = keyset_query(model, fields, order_by, filters, cursor, limit)
+    rows = db.session.execute(query).mappings().all()
+    return keyset_result(rows, fields, order_by, limit)
@@ -0,0 +1,89 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+class PoolBusy(Exception):
+    """Every hashing slot stayed taken for PASSWORD_QUEUE_TIMEOUT seconds."""
+
+
+# bcrypt is imported where it is used, so that processes which never hash
+# a password (the API, the CLI, the hashing pool's parent) don't load it.
+def _hash(password, rounds):
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(hashed, password):
+    import bcrypt
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:  # not a bcrypt hash
+        return False
+
+
+def _pool():
+    global _executor, _slots
+    with _lock:
+        if _slots is None:
+            workers = current_app.config['PASSWORD_WORKERS']
+            if workers:
+                _executor = ProcessPoolExecutor(max_workers=workers)
+            # Bounds the work queued behind the pool; past this, callers wait
+            # briefly and are then turned away instead of piling up.
+            _slots = threading.BoundedSemaphore(max(workers, 1) * current_app.config['PASSWORD_QUEUE_FACTOR'])
+        return _executor, _slots
+
+
+def shutdown():
+    """Stop the pool; the next call starts a new one from the current config."""
+    global _executor, _slots
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = _slots = None
+
+
+def _run(fn, *args):
+    executor, slots = _pool()
+    if not slots.acquire(timeout=current_app.config['PASSWORD_QUEUE_TIMEOUT']):
+        raise PoolBusy()
+    try:
+        if executor is None:
+            return fn(*args)
+        return executor.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    """bcrypt hash of password at the configured cost, computed off-thread."""
+    return _run(_hash, password, current_app.config['BCRYPT_LOG_ROUNDS'])
+
+
+def check_password(hashed, password):
+    return _run(_check, hashed, password)
+
+
+def needs_rehash(hashed):
+    """True when hashed was made with a different cost than the configured one."""
+    try:
+        return int(hashed.split('$')[2]) != current_app.config['BCRYPT_LOG_ROUNDS']
+    except (IndexError, ValueError):
+        return True
+
+
+def verify_and_upgrade(account, password):
+    """Check password against account and re-hash it at the current cost.
+
+    The new hash is assigned to account.password; the caller commits.
+    """
+    if not check_password(account.password, password):
+        return False
+    if needs_rehash(account.password):
+        account.password = hash_password(password)
+    return True
@@ -0,0 +1,171 @@
+import click
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from flask import current_app, g, has_request_context, request
+from flask.cli import with_appcontext
+from itsdangerous import BadSignature, TimestampSigner
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from flaskshow import db
+
+# executemany parameter lists are cut down to this many rows when recorded
+MAX_PARAMETER_ROWS = 10
+
+slow_log = logging.getLogger('flaskshow.slow_queries')
+slow_log.propagate = False
+_slow_log_lock = threading.Lock()
+_slow_logs = {}  # log file path -> its logger, a child of slow_log
+# The statement hooks fire on every engine, the async API's included, with
+# or without an app context; each engine carries its app's settings here.
+_settings = weakref.WeakKeyDictionary()  # engine -> (config, instance_path)
+
+
+def _signer():
+    return TimestampSigner(current_app.config['SECRET_KEY'], salt='flaskshow.profiler')
+
+
+def make_token():
+    """A PROFILE_HEADER value that turns the profiler on for PROFILE_TOKEN_MAX_AGE seconds."""
+    return _signer().sign('profile').decode('ascii')
+
+
+def requested():
+    if current_app.config['PROFILER_ENABLED']:
+        return True
+    token = request.headers.get(current_app.config['PROFILE_HEADER'])
+    if not token:
+        return False
+    try:
+        _signer().unsign(token, max_age=current_app.config['PROFILE_TOKEN_MAX_AGE'])
+    except BadSignature:  # expired tokens included
+        return False
+    return True
+
+
+def watch(engine, app):
+    """Log and profile the statements run on engine with the settings of app."""
+    _settings[engine] = (app.config, app.instance_path)
+
+
+def _slow_log(config, instance_path):
+    path = config['SLOW_QUERY_LOG'] or os.path.join(instance_path, 'slow_queries.log')
+    with _slow_log_lock:
+        log = _slow_logs.get(path)
+        if log is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=config['SLOW_QUERY_LOG_BYTES'],
+                                          backupCount=config['SLOW_QUERY_LOG_BACKUPS'])
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            log = _slow_logs[path] = slow_log.getChild(str(len(_slow_logs)))
+            log.addHandler(handler)
+            log.setLevel(logging.INFO)
+    return log
+
+
+def _types(parameters):
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _parameters(parameters, executemany, config):
+    if not config['LOG_QUERY_PARAMETERS']:
+        # values include password hashes, emails and phone numbers
+        if executemany:
+            return {'rows': len(parameters), 'types': _types(parameters[0]) if parameters else None}
+        return _types(parameters)
+    if executemany and len(parameters) > MAX_PARAMETER_ROWS:
+        return list(parameters[:MAX_PARAMETER_ROWS]) + ['... %d more' % (len(parameters) - MAX_PARAMETER_ROWS)]
+    return parameters
+
+
+def _route():
+    if not has_request_context():
+        return {'route': None}
+    return {'route': request.endpoint, 'method': request.method, 'path': request.full_path.rstrip('?')}
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _statement_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info['profile_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('profile_started', None)
+    settings = _settings.get(conn.engine)
+    if started is None or settings is None:
+        return
+    config, instance_path = settings
+    ms = (time.perf_counter() - started) * 1000
+    profile = g.get('profile') if has_request_context() else None
+    threshold = config['SLOW_QUERY_MS']
+    if profile is None and not (threshold and ms >= threshold):
+        return
+    entry = {'ms': round(ms, 3), 'statement': statement,
+             'parameters': _parameters(parameters, executemany, config), 'executemany': executemany}
+    if profile is not None:
+        profile['statements'].append(entry)
+    if threshold and ms >= threshold:
+        _slow_log(config, instance_path).info(json.dumps({'at': datetime.utcnow().isoformat(), **_route(), **entry}, default=str))
+
+
+def _start_profile():
+    if not requested():
+        return
+    g.profile = {'started': time.perf_counter(), 'statements': []}
+    if current_app.config['PROFILE_CPROFILE']:
+        g.profile['cprofile'] = cProfile.Profile()
+        g.profile['cprofile'].enable()
+
+
+def _finish_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    cprofile = profile.get('cprofile')
+    if cprofile is not None:
+        cprofile.disable()
+    ms = (time.perf_counter() - profile['started']) * 1000
+    sql_ms = sum(entry['ms'] for entry in profile['statements'])
+    directory = current_app.config['PROFILE_DIR'] or os.path.join(current_app.instance_path, 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    name = '%s-%s-%d' % (datetime.utcnow().strftime('%Y%m%dT%H%M%S.%f'), request.endpoint or 'unmatched', os.getpid())
+    report = {**_route(), 'status': response.status_code, 'ms': round(ms, 3),
+              'sql_ms': round(sql_ms, 3), 'statements': profile['statements']}
+    with open(os.path.join(directory, name + '.json'), 'w') as f:
+        json.dump(report, f, indent=1, default=str)
+    if cprofile is not None:
+        # pstats format: snakeviz, flameprof or `python -m pstats` read it
+        cprofile.dump_stats(os.path.join(directory, name + '.prof'))
+    response.headers['X-Profile'] = name
+    response.headers['X-Profile-SQL'] = 'statements=%d; ms=%.1f' % (len(profile['statements']), sql_ms)
+    return response
+
+
+def init_app(app):
+    with app.app_context():
+        for engine in db.engines.values():
+            watch(engine, app)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+
+
+@click.command('profile-token')
+@with_appcontext
+def profile_token_command():
+    """Print a header that turns the profiler on for one client."""
+    print('%s: %s' % (current_app.config['PROFILE_HEADER'], make_token()))
+    print('valid for %d seconds' % current_app.config['PROFILE_TOKEN_MAX_AGE'])
+
+
+COMMANDS = (profile_token_command,)
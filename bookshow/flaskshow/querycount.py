@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from flaskshow import db
+
+
+def is_query(statement):
+    # BEGIN/COMMIT and PRAGMAs are not queries a view is responsible for
+    return not statement.lstrip().upper().startswith(('BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA'))
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+        self.parameters = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if is_query(statement):
+            self.statements.append(statement)
+            self.parameters.append(None if executemany else parameters)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Count the SQL statements executed inside the block.
+
+        with count_queries() as counter:
+            client.get('/shows_list')
+        print(counter.count)
+    """
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._record)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._record)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """Fail with AssertionError if the block runs more than limit statements."""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        raise AssertionError('%d SQL statements executed, at most %d expected:\n%s'
+                             % (counter.count, limit, '\n'.join(counter.statements)))
@@ -0,0 +1,111 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app, jsonify, request, session
+from flaskshow import metrics
+
+_lock = threading.Lock()
+
+
+class BucketStore:
+    """Token buckets in their own SQLite file, shared by every worker on the host.
+
+    Taking a token is one UPSERT: the bucket is refilled for the time since
+    it was last used and then charged, atomically, so concurrent workers
+    never hand out the same token twice.
+    """
+
+    PURGE_EVERY = 1000
+    IDLE_SECONDS = 3600  # buckets unused this long are full again anyway
+
+    TAKE = ('INSERT INTO bucket (key, tokens, updated, allowed) VALUES (:key, :size - 1, :now, 1) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'allowed = min(:size, tokens + (:now - updated) * :rate) >= 1, '
+            'tokens = min(:size, tokens + (:now - updated) * :rate) '
+            '- (min(:size, tokens + (:now - updated) * :rate) >= 1), '
+            'updated = :now '
+            'RETURNING tokens, allowed')
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        self._connection().execute('CREATE TABLE IF NOT EXISTS bucket '
+                                   '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, '
+                                   'allowed INTEGER NOT NULL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # counters, not records: losing the last few on a power cut is fine
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, size, rate):
+        """Take a token from the bucket; returns 0 if one was free, else seconds until one is."""
+        now = time.time()
+        conn = self._connection()
+        tokens, allowed = conn.execute(self.TAKE, {'key': key, 'size': size, 'rate': rate, 'now': now}).fetchone()
+        self._takes += 1
+        if self._takes % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM bucket WHERE updated < ?', (now - self.IDLE_SECONDS,))
+        return 0 if allowed else (1 - tokens) / rate
+
+
+def store():
+    """The app's BucketStore, opened on first use so nothing is opened before a fork."""
+    with _lock:
+        bucket_store = current_app.extensions.get('ratelimit')
+        if bucket_store is None:
+            path = current_app.config['RATE_LIMIT_PATH'] or os.path.join(current_app.instance_path, 'ratelimit.db')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            bucket_store = current_app.extensions['ratelimit'] = BucketStore(path)
+    return bucket_store
+
+
+def limit_for(endpoint, method):
+    """(RATE_LIMITS key, (requests, seconds)) for the request, or None if it is not limited.
+
+    RATE_LIMITS keys are endpoint names, or "METHOD endpoint" to limit one
+    method only; the method-specific entry wins. Each key is one bucket.
+    """
+    limits = current_app.config['RATE_LIMITS']
+    for key in ('%s %s' % (method, endpoint), endpoint):
+        if key in limits:
+            return key, limits[key]
+    return None
+
+
+def client_key():
+    # the signed-in account from the session cookie, so no user is loaded
+    return session.get('_user_id') or 'ip:%s' % request.remote_addr
+
+
+def _check():
+    if not current_app.config['RATE_LIMIT_ENABLED'] or request.endpoint is None:
+        return None
+    limit = limit_for(request.endpoint, request.method)
+    if limit is None:
+        return None
+    name, (requests, seconds) = limit
+    wait = store().take('%s|%s' % (name, client_key()), requests, requests / seconds)
+    if not wait:
+        return None
+    if current_app.config['METRICS_ENABLED']:
+        # the request hooks in metrics never see a request turned away here
+        metrics.inc('flaskshow_rate_limited_total', (('endpoint', request.endpoint),))
+    response = jsonify(errors={'rate_limit': ['Too many requests; try again in %d seconds.' % math.ceil(wait)]})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def init_app(app):
+    # Ahead of every other before_request hook: CSRFProtect's reads the form,
+    # and an over-limit client should not get even that far.
+    app.before_request_funcs.setdefault(None, []).insert(0, _check)
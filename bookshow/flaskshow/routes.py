@@ -1,32 +1,83 @@
-import os
-import secrets
-from PIL import Image
+import io
 from functools import wraps
-from datetime import datetime,date, time
-from flask import jsonify
-from flask_wtf.csrf import CSRFProtect, generate_csrf
-from flask import render_template,redirect, url_for, flash,session,request,g, current_app
-from flaskshow import app,db,bcrypt , user_login_manager, admin_login_manager
+from datetime import datetime,date, time, timedelta
+from flask import Blueprint, jsonify
+from flask import render_template,redirect, url_for, flash,session,request,g, current_app, stream_with_context
+from flaskshow import db, bulk, export, images, inventory, metrics, pagination, passwords, sales, schedule, search, waiting_room
+from flaskshow.versioning import conditional
+from flaskshow.engine import read_only
 from flaskshow.models import Admin, Event, Venue, Ticket, Buyer
+from flaskshow.cache import cache
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, load_only
 from flask_login import login_user, logout_user, login_required, current_user, login_manager
 from werkzeug.exceptions import abort
 from flaskshow.forms import BuyerRegistrationForm, AdminRegistrationForm, BuyerLoginForm,AdminLoginForm, VenueForm, EventForm, DeleteVenueForm, EditVenueForm, BuyTicketForm,DeleteShowForm
 
-csrf = CSRFProtect(app)
+# The public pages, the buyer's and the admin's pages, and the JSON API.
+main = Blueprint('main', __name__)
+buyers = Blueprint('buyer', __name__)
+admins = Blueprint('admin', __name__)
+api = Blueprint('api', __name__, url_prefix='/api')
 
-@app.route('/api/venues', methods=['GET'])
+VENUE_FIELDS = ('id', 'name', 'address', 'capacity')
+SHOW_FIELDS = ('id', 'name', 'start_time', 'end_time', 'venue_id')
+SHOW_EXTRA_FIELDS = ('ticket_price', 'image', 'image_variants')
+CART_MAX_LINES = 50
+SHOW_TIME_FORMAT = '%Y-%m-%d %H:%M'
+CALENDAR_MAX_DAYS = 92
+
+
+def _api_page(model, allowed, default, order_by, filters=()):
+    """Keyset-paginate an API listing from the request's query string.
+
+    ?all=1 keeps the old unpaginated response for existing clients.
+    """
+    fields = pagination.parse_fields(request.args.get('fields'), allowed, default)
+    if pagination.parse_bool(request.args.get('all'), 'all'):
+        limit = None
+    else:
+        limit = pagination.parse_limit(request.args.get('limit'))
+    return pagination.keyset_page(model, fields, order_by, filters,
+                                  cursor=request.args.get('cursor'), limit=limit)
+
+
+@main.app_errorhandler(passwords.PoolBusy)
+def password_pool_busy(error):
+    return 'Too many sign-ins right now, please try again in a moment.', 503, {'Retry-After': '1'}
+
+
+@api.app_errorhandler(pagination.InvalidQuery)
+def invalid_api_query(error):
+    return jsonify(errors={'query': [str(error)]}), 400
+
+
+@main.route('/metrics')
+def prometheus_metrics():
+    if not metrics.scrape_allowed():
+        abort(403)
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@api.route('/venues', methods=['GET'])
+@read_only
+@conditional('venue')
+@cache.cached('venues')
 def get_venues():
-    venues = Venue.query.all()
-    serialized_venues = [{'id': v.id, 'name': v.name, 'address': v.address, 'capacity': v.capacity} for v in venues]
-    return jsonify(venues=serialized_venues)
+    venues, next_cursor = _api_page(Venue, VENUE_FIELDS, VENUE_FIELDS, ['id'])
+    if pagination.parse_bool(request.args.get('all'), 'all'):
+        return jsonify(venues=venues)
+    return jsonify(venues=venues, next=next_cursor)
 
-@app.route('/api/venues/<int:venue_id>', methods=['GET'])
+@api.route('/venues/<int:venue_id>', methods=['GET'])
+@read_only
+@conditional('venue')
 def get_venue(venue_id):
     venue = Venue.query.get_or_404(venue_id)
     serialized_venue = {'id': venue.id, 'name': venue.name, 'address': venue.address, 'capacity': venue.capacity}
     return jsonify(venue=serialized_venue)
 
-@app.route('/api/venues', methods=['POST'])
+@api.route('/venues', methods=['POST'])
 def create_venue():
     form = VenueForm()
     if form.validate_on_submit():
@@ -36,7 +87,7 @@ def create_venue():
         return jsonify(message='Venue created successfully')
     return jsonify(errors=form.errors), 400
 
-@app.route('/api/venues/<int:venue_id>', methods=['PUT'])
+@api.route('/venues/<int:venue_id>', methods=['PUT'])
 def update_venue(venue_id):
     venue = Venue.query.get_or_404(venue_id)
     form = VenueForm(obj=venue)
@@ -44,11 +95,12 @@ def update_venue(venue_id):
         venue.name = form.name.data
         venue.address = form.address.data
         venue.capacity = form.capacity.data
+        inventory.resize_venue(venue.id)
         db.session.commit()
         return jsonify(message='Venue updated successfully')
     return jsonify(errors=form.errors), 400
 
-@app.route('/api/venues/<int:venue_id>', methods=['DELETE'])
+@api.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     venue = Venue.query.get_or_404(venue_id)
     db.session.delete(venue)
@@ -57,96 +109,596 @@ def delete_venue(venue_id):
 
 
 # API endpoints for shows
-@app.route('/api/shows', methods=['GET'])
+@api.route('/shows', methods=['GET'])
+@read_only
+@conditional('event')
+@cache.cached('events')
 def get_shows():
-    shows = Show.query.all()
-    serialized_shows = [{'id': s.id, 'name': s.name, 'start_time': s.start_time.isoformat(),
-                         'end_time': s.end_time.isoformat(), 'venue_id': s.venue_id} for s in shows]
-    return jsonify(shows=serialized_shows)
+    filters = []
+    venue_id = pagination.parse_int(request.args.get('venue_id'), 'venue_id')
+    if venue_id is not None:
+        filters.append(Event.venue_id == venue_id)
+    starts_from = pagination.parse_datetime(request.args.get('from'), 'from')
+    if starts_from is not None:
+        filters.append(Event.start_time >= starts_from)
+    starts_to = pagination.parse_datetime(request.args.get('to'), 'to')
+    if starts_to is not None:
+        filters.append(Event.start_time < starts_to)
+    shows, next_cursor = _api_page(Event, SHOW_FIELDS + SHOW_EXTRA_FIELDS, SHOW_FIELDS,
+                                   ['start_time', 'id'], filters)
+    if pagination.parse_bool(request.args.get('all'), 'all'):
+        return jsonify(shows=shows)
+    return jsonify(shows=shows, next=next_cursor)
 
-@app.route('/api/shows/<int:show_id>', methods=['GET'])
+@api.route('/shows/<int:show_id>', methods=['GET'])
+@read_only
+@conditional('event')
 def get_show(show_id):
-    show = Show.query.get_or_404(show_id)
+    show = Event.query.get_or_404(show_id)
     serialized_show = {'id': show.id, 'name': show.name, 'start_time': show.start_time.isoformat(),
                        'end_time': show.end_time.isoformat(), 'venue_id': show.venue_id}
     return jsonify(show=serialized_show)
 
-@app.route('/api/shows', methods=['POST'])
+def _schedule_row(row):
+    return {'id': row.id, 'name': row.name, 'start_time': row.start_time.isoformat(),
+            'end_time': row.end_time.isoformat(), 'venue_id': row.venue_id, 'ticket_price': row.ticket_price}
+
+
+@api.route('/shows/upcoming', methods=['GET'])
+@read_only
+def upcoming_shows():
+    """The next shows to start, everywhere or at ?venue_id=, from now or ?from=."""
+    limit = pagination.parse_limit(request.args.get('limit'))
+    after = pagination.parse_datetime(request.args.get('from'), 'from')
+    rows = schedule.upcoming(limit, pagination.parse_int(request.args.get('venue_id'), 'venue_id'), after)
+    return jsonify(shows=[_schedule_row(row) for row in rows])
+
+
+@api.route('/venues/<int:venue_id>/calendar', methods=['GET'])
+@read_only
+def venue_calendar(venue_id):
+    """Shows at the venue overlapping ?from= to ?to=, this week by default."""
+    if db.session.get(Venue, venue_id) is None:
+        abort(404)
+    start = pagination.parse_datetime(request.args.get('from'), 'from') or schedule.this_week()[0]
+    end = pagination.parse_datetime(request.args.get('to'), 'to') or start + timedelta(days=7)
+    if not start < end <= start + timedelta(days=CALENDAR_MAX_DAYS):
+        raise pagination.InvalidQuery('to must be after from, and at most %d days later' % CALENDAR_MAX_DAYS)
+    rows = schedule.calendar(venue_id, start, end)
+    return jsonify(venue_id=venue_id, start=start.isoformat(), end=end.isoformat(),
+                   shows=[_schedule_row(row) for row in rows])
+
+
+def _api_show_form(event=None):
+    form = EventForm(obj=event)
+    form.venue.choices = [(v.id, v.name) for v in Venue.query.options(load_only(Venue.id, Venue.name))]
+    return form
+
+
+def _api_schedule_error(error):
+    # a clash is a conflict with another show; anything else is bad input
+    status = 409 if isinstance(error, schedule.Clash) else 400
+    return jsonify(errors={'start_time': [_schedule_error(error)]}), status
+
+
+@api.route('/shows', methods=['POST'])
 def create_show():
-    form = ShowForm()
+    form = _api_show_form()
     if form.validate_on_submit():
-        show = Show(name=form.name.data, start_time=form.start_time.data,
-                    end_time=form.end_time.data, venue_id=form.venue_id.data)
-        db.session.add(show)
-        db.session.commit()
+        try:
+            start_time, end_time = _show_times(form)
+            show = Event(name=form.name.data, start_time=start_time, end_time=end_time,
+                         venue_id=int(form.venue.data), ticket_price=form.ticket_price.data)
+            with inventory.write_transaction():
+                schedule.check(show.venue_id, start_time, end_time)
+                db.session.add(show)
+        except (ValueError, schedule.Clash) as error:
+            return _api_schedule_error(error)
         return jsonify(message='Show created successfully')
     return jsonify(errors=form.errors), 400
 
-@app.route('/api/shows/<int:show_id>', methods=['PUT'])
+@api.route('/shows/<int:show_id>', methods=['PUT'])
 def update_show(show_id):
-    show = Show.query.get_or_404(show_id)
-    form = ShowForm(obj=show)
+    show = Event.query.get_or_404(show_id)
+    form = _api_show_form(show)
     if form.validate_on_submit():
-        show.name = form.name.data
-        show.start_time = form.start_time.data
-        show.end_time = form.end_time.data
-        show.venue_id = form.venue_id.data
-        db.session.commit()
+        try:
+            start_time, end_time = _show_times(form)
+            venue_id = int(form.venue.data)
+            with inventory.write_transaction():
+                schedule.check(venue_id, start_time, end_time, exclude=show.id)
+                inventory.move_event(show, venue_id)
+                show.name = form.name.data
+                show.start_time = start_time
+                show.end_time = end_time
+                show.ticket_price = form.ticket_price.data
+        except (ValueError, schedule.Clash) as error:
+            return _api_schedule_error(error)
         return jsonify(message='Show updated successfully')
     return jsonify(errors=form.errors), 400
 
-@app.route('/api/shows/<int:show_id>', methods=['DELETE'])
+@api.route('/shows/<int:show_id>', methods=['DELETE'])
 def delete_show(show_id):
-    show = Show.query.get_or_404(show_id)
+    show = Event.query.get_or_404(show_id)
+    if has_tickets(show.id):
+        return jsonify(errors={'tickets': ['Tickets have been sold for this show, so it cannot be deleted.']}), 409
     db.session.delete(show)
     db.session.commit()
     return jsonify(message='Show deleted successfully')
 
 
 
-def save_picture(form_picture):
-    random_hex = secrets.token_hex(8)
-    _, f_ext = os.path.splitext(form_picture.filename)
-    picture_fn = random_hex + f_ext
-    picture_path = os.path.join(app.root_path, 'static/event_images', picture_fn)
-    output_size = (500, 500)
-    image = Image.open(form_picture)
-    image.thumbnail(output_size)
-    image.save(picture_path)
-    return picture_fn
+def has_tickets(event_id):
+    """Whether any tickets were sold for the event; they are purchase records and must stay."""
+    return db.session.execute(select(Ticket.id).where(Ticket.event_id == event_id).limit(1)).first() is not None
+
+
+def user_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated or not current_user.is_buyer():
+            return redirect(url_for('buyer.user_login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def admin_login_required(func):
+    @wraps(func)
+    def decorated_view(*args, **kwargs):
+        if not current_user.is_authenticated or not current_user.is_admin():
+            return abort(401)  # Unauthorized
+        return func(*args, **kwargs)
+    return decorated_view
+
+
+def event_listing():
+    """Events for the listing pages, with their venue joined in.
+
+    Loads only the columns the templates render, in one statement no matter
+    how many events there are.
+    """
+    return (Event.query
+            .options(load_only(Event.id, Event.name, Event.start_time, Event.end_time,
+                               Event.image, Event.image_variants, Event.ticket_price, Event.venue_id),
+                     joinedload(Event.venue).load_only(Venue.id, Venue.name))
+            .order_by(Event.start_time, Event.id)
+            .all())
+
+def venue_listing():
+    return (Venue.query
+            .options(load_only(Venue.id, Venue.name, Venue.address, Venue.capacity))
+            .order_by(Venue.id)
+            .all())
+
+@main.route('/')
+@read_only
+@cache.cached('events', 'venues')
+def home():
+    events = event_listing()
+    return render_template('home.html', events=events)
+@buyers.route("/user")
+@user_login_required
+def user_dashboard():
+    events = event_listing()
+    return render_template('user_dashboard.html', events=events)
+
+@admins.route("/admin")
+@admin_login_required
+def admin_dashboard():
+    venues = venue_listing()
+    events = event_listing()
+    event_sales = {row.id: row for row in sales.event_report()}
+    venue_sales = {row.id: row for row in sales.venue_report()}
+    return render_template("admin_dashboard.html", venues=venues, events=events,
+                           event_sales=event_sales, venue_sales=venue_sales,
+                           delete_venue_form=DeleteVenueForm(), delete_show_form=DeleteShowForm())
+
+
+@buyers.route('/user/signup', methods=['GET', 'POST'])
+def user_signup():
+    form = BuyerRegistrationForm()
+    if form.validate_on_submit():
+        hashed_password = passwords.hash_password(form.password.data)
+        buyer = Buyer(name=form.name.data, email=form.email.data, password=hashed_password,phone=form.phone.data, tickets_purchased=[])
+        db.session.add(buyer)
+        db.session.commit()
+        flash('Your account has been created! You are now able to log in', 'success')
+        return redirect(url_for('buyer.user_login'))
+    return render_template('user_signup.html', form=form)
+
+
+@admins.route('/admin/signup', methods=['GET', 'POST'])
+def admin_signup():
+    form = AdminRegistrationForm()
+    if form.validate_on_submit():
+        hashed_password = passwords.hash_password(form.password.data)
+        admin = Admin(username=form.username.data, email=form.email.data, password=hashed_password, venue_id=form.venue_id.data)
+        db.session.add(admin)
+        db.session.commit()
+        flash('Congratulations, you are now a registered admin!')
+        return redirect(url_for('admin.admin_login'))
+    return render_template('admin_signup.html', form=form)
+
+
+@buyers.route('/user/login', methods=['GET', 'POST'])
+def user_login():
+    if current_user.is_authenticated and current_user.is_buyer():
+        return redirect(url_for('buyer.user_dashboard'))
+    form = BuyerLoginForm()
+    if form.validate_on_submit():
+        buyer = Buyer.query.filter_by(email=form.email.data).first()
+        if buyer and passwords.verify_and_upgrade(buyer, form.password.data):
+            db.session.commit()
+            login_user(buyer)
+            flash('You have been logged in!', 'success')
+            return redirect(url_for('buyer.user_dashboard'))
+        else:
+            flash('Login Unsuccessful. Please check email and password', 'danger')
+    return render_template('user_login.html', form=form)
+
+@admins.route('/admin/login', methods=['GET', 'POST'])
+def admin_login():
+    if current_user.is_authenticated and current_user.is_admin():
+        return redirect(url_for('admin.admin_dashboard'))
+    form = AdminLoginForm()
+    if form.validate_on_submit():
+        admin = Admin.query.filter_by(email=form.email.data).first()
+        if admin and passwords.verify_and_upgrade(admin, form.password.data):
+            db.session.commit()
+            login_user(admin)
+            flash('You have been logged in!', 'success')
+            return redirect(url_for('admin.admin_dashboard'))
+        else:
+            flash('Login Unsuccessful. Please check email and password', 'danger')
+    return render_template('admin_login.html', form=form)
+
+@admins.route('/admin/add_venue', methods=['GET', 'POST'])
+@admin_login_required
+def add_venue():
+    form = VenueForm()
+    if form.validate_on_submit():
+        venue = Venue(name=form.name.data,address=form.address.data, capacity=form.capacity.data,id=form.venue_id.data )
+        db.session.add(venue)
+        db.session.commit()
+        flash('The venue has been added.', 'success')
+        return redirect(url_for('main.venues_list'))
+    return render_template('add_venue.html', form=form)
+
+def _show_times(form):
+    try:
+        return (datetime.strptime(form.start_time.data.strip(), SHOW_TIME_FORMAT),
+                datetime.strptime(form.end_time.data.strip(), SHOW_TIME_FORMAT))
+    except ValueError:
+        raise ValueError('Enter the start and end times as YYYY-MM-DD HH:MM.')
+
+
+def _schedule_error(error):
+    if isinstance(error, schedule.Clash):
+        clash = error.event
+        return 'That time clashes with "%s" (%s to %s) at this venue.' % (
+            clash.name, clash.start_time.strftime(SHOW_TIME_FORMAT), clash.end_time.strftime(SHOW_TIME_FORMAT))
+    return str(error)
+
+
+@admins.route('/admin/add_show', methods=['GET', 'POST'])
+@admin_login_required
+def add_show():
+    form = EventForm()
+    form.venue.choices = [(v.id, v.name) for v in Venue.query.options(load_only(Venue.id, Venue.name))]
+    if form.validate_on_submit():
+        try:
+            start_time, end_time = _show_times(form)
+            event = Event(
+                name=form.name.data,start_time=start_time,end_time=end_time,venue_id=int(form.venue.data),ticket_price=form.ticket_price.data)
+            if form.image.data:
+                save_picture(form.image.data, event)
+            with inventory.write_transaction():
+                schedule.check(event.venue_id, start_time, end_time)
+                db.session.add(event)
+        except images.InvalidImage:
+            flash('That file is not an image we can read.', 'danger')
+            return render_template('add_show.html', title='Add Show', form=form)
+        except (ValueError, schedule.Clash) as error:
+            flash(_schedule_error(error), 'danger')
+            return render_template('add_show.html', title='Add Show', form=form)
+        render_picture(event)
+        flash('Your show has been added!', 'success')
+        return redirect(url_for('admin.admin_dashboard'))
+    return render_template('add_show.html', title='Add Show', form=form)
+
+
+@main.route('/venues/<int:venue_id>')
+@read_only
+@cache.cached('events', 'venues')
+def venue_details(venue_id):
+    venue = Venue.query.options(load_only(Venue.id, Venue.name, Venue.address, Venue.capacity)).get_or_404(venue_id)
+    shows = schedule.upcoming(20, venue_id=venue.id)
+    return render_template('venue_details.html', venue=venue, shows=shows)
+
+
+@main.route('/venues_list')
+@read_only
+@cache.cached('venues')
+def venues_list():
+    venues = venue_listing()
+    return render_template('venues_list.html', venues=venues)
+
+
+@main.route('/shows_list')
+@read_only
+@cache.cached('events', 'venues')
+def shows_list():
+    events = event_listing()
+    return render_template('shows_list.html', events=events)
+
+@admins.route('/admin/edit_venue/<int:venue_id>', methods=['GET', 'POST'])
+@admin_login_required
+def edit_venue(venue_id):
+    venue = Venue.query.get_or_404(venue_id)
+    form = EditVenueForm()
+    if form.validate_on_submit():
+        venue.name = form.name.data
+        venue.address = form.address.data
+        venue.capacity = form.capacity.data
+        inventory.resize_venue(venue.id)
+        db.session.commit()
+        flash('The venue has been updated.', 'success')
+        return redirect(url_for('main.venues_list'))
+    elif request.method == 'GET':
+        form.name.data = venue.name
+        form.address.data = venue.address
+        form.capacity.data = venue.capacity
+    return render_template('edit_venue.html', form=form, venue=venue)
+
+@admins.route('/admin/delete_venue/<int:venue_id>', methods=['GET', 'POST'])
+@admin_login_required
+def admin_delete_venue(venue_id):
+    venue = Venue.query.get_or_404(venue_id)
+    form = DeleteVenueForm()
+    if form.validate_on_submit():
+        db.session.delete(venue)
+        db.session.commit()
+        flash('The venue has been deleted.', 'success')
+        return redirect(url_for('main.venues_list'))
+    return render_template('delete_venue.html', venue=venue, form=form)
 
-@app.route('/buy_ticket/<int:event_id>', methods=['GET', 'POST'])
+
+@admins.route('/admin/edit_show/<int:event_id>', methods=['GET', 'POST'])
+@admin_login_required
+def edit_show(event_id):
+    event = Event.query.get_or_404(event_id)
+    form = EventForm(obj=event)
+    venues = Venue.query.options(load_only(Venue.id, Venue.name)).all()
+    form.venue.choices = [(v.id, v.name) for v in venues]
+    if form.validate_on_submit():
+        try:
+            start_time, end_time = _show_times(form)
+            venue_id = int(form.venue.data)
+            with inventory.write_transaction():
+                # change the event only in here: write_transaction() first
+                # commits whatever the session already holds
+                schedule.check(venue_id, start_time, end_time, exclude=event.id)
+                inventory.move_event(event, venue_id)
+                event.name = form.name.data
+                event.start_time = start_time
+                event.end_time = end_time
+                if form.image.data:
+                    save_picture(form.image.data, event)
+        except images.InvalidImage:
+            flash('That file is not an image we can read.', 'danger')
+            return render_template('edit_show.html', title='Edit Show', form=form, event=event, venues=venues)
+        except (ValueError, schedule.Clash) as error:
+            flash(_schedule_error(error), 'danger')
+            return render_template('edit_show.html', title='Edit Show', form=form, event=event, venues=venues)
+        render_picture(event)
+        flash('Your changes have been saved!', 'success')
+        return redirect(url_for('admin.admin_dashboard'))
+    return render_template('edit_show.html', title='Edit Show', form=form, event=event, venues=venues)
+
+
+@admins.route('/admin/delete_show/<int:event_id>', methods=['GET', 'POST'])
+@admin_login_required
+def admin_delete_show(event_id):
+    event = Event.query.get_or_404(event_id)
+    form = DeleteShowForm()
+    if form.validate_on_submit():
+        if has_tickets(event.id):
+            flash('Tickets have been sold for this event, so it cannot be deleted.', 'danger')
+        else:
+            db.session.delete(event)
+            db.session.commit()
+            flash('The event has been deleted.', 'success')
+            return redirect(url_for('main.shows_list'))
+    return render_template('delete_show.html', event=event, form=form)
+
+
+@api.route('/reports/sales')
+@admin_login_required
+def sales_report():
+    """Tickets sold, revenue and seats left per event and per venue."""
+    return jsonify(events=[dict(row._mapping) for row in sales.event_report()],
+                   venues=[dict(row._mapping) for row in sales.venue_report()])
+
+
+@api.route('/export/<kind>')
+@admin_login_required
+@read_only
+def export_data(kind):
+    """Stream tickets or events as CSV or NDJSON, filtered by from/to/venue_id/event_id."""
+    if kind not in export.KINDS:
+        abort(404)
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.MIMETYPES:
+        return jsonify(errors={'format': ['format must be one of: %s' % ', '.join(export.MIMETYPES)]}), 400
+    try:
+        filters = export.parse_filters(request.args)
+    except export.InvalidExport as error:
+        return jsonify(errors={'query': [str(error)]}), 400
+    # run the query now, inside read_only(); rows are fetched as the body is sent
+    result = export.open_rows(kind, filters)
+    response = current_app.response_class(stream_with_context(export.generate(result, fmt)),
+                                  mimetype=export.MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, fmt)
+    response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass chunks straight through
+    return response
+
+
+@api.route('/import/<kind>', methods=['POST'])
+@admin_login_required
+def bulk_import(kind):
+    """Stream a CSV or NDJSON body of venues, events or tickets into the database."""
+    if kind not in bulk.KINDS:
+        abort(404)
+    try:
+        fmt = bulk.detect_format(request.args.get('format'), request.mimetype)
+    except bulk.InvalidImport as error:
+        return jsonify(errors={'format': [str(error)]}), 400
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', errors='surrogateescape', newline='')
+    result = bulk.import_rows(kind, bulk.read_rows(stream, fmt))
+    return jsonify(result.as_dict())
+
+
+def save_picture(form_picture, event):
+    """Store the upload as event's image. Only the original is written here."""
+    event.image = images.store_original(form_picture)
+    event.image_variants = images.available(event.image)
+
+def render_picture(event):
+    # Queue the resized renditions once the event is committed; the worker
+    # records them on the event row when it finishes.
+    if event.image and not images.complete(event.image_variants):
+        images.render_async(event.image)
+
+@buyers.route('/buy_ticket/<int:event_id>', methods=['GET', 'POST'])
+@user_login_required
+@waiting_room.admission_required
 def buy_ticket(event_id):
     form = BuyTicketForm()
-    event = Event.query.get(event_id)
-    buyer = Buyer.query.get(session['buyer_id'])
+    event = Event.query.get_or_404(event_id)
+    buyer = current_user
     ticket = Ticket(
         event_id=event.id,
         price=event.ticket_price,
         quantity=form.quantity.data
     )
     if form.validate_on_submit():
-        buyer.tickets_purchased.append(ticket)
-        db.session.add(buyer)
-        db.session.add(ticket)
-        db.session.commit()
-        flash('Ticket purchased successfully!', 'success')
-        return redirect(url_for('user_dashboard'))
-    return render_template('buy_ticket.html', event=event, form=form, ticket=ticket)
+        try:
+            inventory.purchase(event, buyer.id, form.quantity.data)
+        except inventory.SoldOut:
+            flash('Sorry, there are not enough seats left for this show.', 'danger')
+        else:
+            flash('Ticket purchased successfully!', 'success')
+            return redirect(url_for('buyer.user_dashboard'))
+    hold = None
+    if request.method == 'GET':
+        form.quantity.data = request.args.get('quantity', 1, type=int)
+        if not form.quantity.validate(form):
+            abort(400)
+        try:
+            hold = inventory.hold_seats(event.id, buyer.id, form.quantity.data)
+        except inventory.SoldOut:
+            flash('Sorry, there are not enough seats left for this show.', 'danger')
+    seats_left = inventory.seats_remaining(event.id)
+    if seats_left == 0 and not inventory.held_seats(event.id):
+        # held seats may still be bought, or come back when the hold lapses
+        waiting_room.mark_sold_out(event.id)
+    return render_template('buy_ticket.html', event=event, form=form, ticket=ticket, hold=hold, seats_left=seats_left)
+
+def _cart_lines(payload):
+    """Parse {"lines": [{"event_id": .., "quantity": .., "price": ..}]} into (lines, errors).
+
+    price is optional; when given it must match the current ticket price.
+    """
+    lines = payload.get('lines') if isinstance(payload, dict) else None
+    if not isinstance(lines, list) or not lines:
+        return None, {'lines': ['Send a non-empty list of lines.']}
+    if len(lines) > CART_MAX_LINES:
+        return None, {'lines': ['At most %d lines per checkout.' % CART_MAX_LINES]}
+    validate = bulk.RowValidator(BuyTicketForm, ('quantity',))
+    parsed, errors = [], {}
+    for i, line in enumerate(lines):
+        if not isinstance(line, dict):
+            errors[i] = {'line': ['Each line must be an object.']}
+            continue
+        form, line_errors = validate(line)
+        try:
+            event_id = int(line.get('event_id'))
+        except (TypeError, ValueError):
+            line_errors['event_id'] = ['Not a valid event.']
+        if line.get('price') is not None and not isinstance(line['price'], (int, float)):
+            line_errors['price'] = ['Not a valid number.']
+        if line_errors:
+            errors[i] = line_errors
+        else:
+            parsed.append((i, event_id, form.quantity.data, line.get('price')))
+    return parsed, errors
+
+
+@api.route('/cart/checkout', methods=['POST'])
+@user_login_required
+def cart_checkout():
+    """Buy tickets for several events at once: all lines succeed or none do."""
+    lines, errors = _cart_lines(request.get_json(silent=True))
+    if errors:
+        return jsonify(errors=errors), 400
+    event_ids = {event_id for _, event_id, _, _ in lines}
+    gone, waiting = waiting_room.gate(sorted(event_ids))
+    if gone:
+        return jsonify(errors={'sold_out': sorted(gone)}), 409
+    if waiting:
+        response = jsonify(errors={'queue': {str(event_id): position for event_id, position in waiting.items()}})
+        response.headers['Retry-After'] = str(max(waiting_room.wait_seconds(event_id, position)
+                                                  for event_id, position in waiting.items()))
+        return response, 429
+    prices = dict(db.session.execute(
+        select(Event.id, Event.ticket_price).where(Event.id.in_(event_ids))).all())
+    unknown = {i: {'event_id': ['Not a valid event.']} for i, event_id, _, _ in lines if event_id not in prices}
+    if unknown:
+        return jsonify(errors=unknown), 400
+    changed = {i: {'price': ['The price is now %s.' % prices[event_id]]}
+               for i, event_id, _, price in lines if price is not None and price != prices[event_id]}
+    if changed:
+        return jsonify(errors=changed), 409
+    try:
+        tickets = inventory.checkout(current_user.id, [(event_id, quantity) for _, event_id, quantity, _ in lines],
+                                     prices)
+    except inventory.SoldOut as error:
+        for event_id in error.args:
+            if inventory.seats_remaining(event_id) == 0 and not inventory.held_seats(event_id):
+                waiting_room.mark_sold_out(event_id)
+        return jsonify(errors={'sold_out': list(error.args)}), 409
+    return jsonify(tickets=[dict(ticket._mapping) for ticket in tickets],
+                   total=sum(ticket.price * ticket.quantity for ticket in tickets)), 201
+
+
+@buyers.route('/queue/<int:event_id>', methods=['GET'])
+def queue_status(event_id):
+    """Where the visitor stands in the event's waiting room. Reads only the queue store."""
+    if not current_app.config['WAITING_ROOM_ENABLED']:
+        return jsonify(admitted=True, sold_out=False, position=0)
+    if waiting_room.sold_out(event_id):
+        return jsonify(admitted=False, sold_out=True, position=None)
+    position = waiting_room.enter(event_id, join=False)
+    if position is None:
+        return jsonify(errors={'queue': ['Open the ticket page to join the queue.']}), 404
+    response = jsonify(admitted=position == 0, sold_out=False, position=position)
+    if position:
+        response.headers['Retry-After'] = str(min(waiting_room.wait_seconds(event_id, position), 10))
+    return response
+
 
-@app.route('/search', methods=['GET'])
+@main.route('/search', methods=['GET'])
 def search_results():
-    query = request.args.get('query')
-    venues = Venue.query.filter(Venue.address.like('%{}%'.format(query))).all()
-    events = Event.query.filter(Event.name.like('%{}%'.format(query))).all()
-    return render_template('search_results.html', query=query, venues=venues, events=events)
+    query = request.args.get('query', '')
+    page = request.args.get('page', 1, type=int)
+    venues, events, has_next = search.search(query, page)
+    return render_template('search_results.html', query=query, venues=venues, events=events, page=page, has_next=has_next)
 
-@app.route("/logout/user")
+@buyers.route("/logout/user")
 def logout_us():
     logout_user()
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-@app.route("/logout/admin")
+@admins.route("/logout/admin")
 def logout_ad():
     logout_user()
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
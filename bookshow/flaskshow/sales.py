@@ -0,0 +1,145 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from flaskshow import db
+from flaskshow.models import Event, EventSales, SeatInventory, Ticket, Venue
+
+
+def _upsert(dialect):
+    if dialect == 'sqlite':
+        stmt = sqlite.insert(EventSales)
+    elif dialect == 'postgresql':
+        stmt = postgresql.insert(EventSales)
+    else:
+        return None
+    return stmt.on_conflict_do_update(
+        index_elements=[EventSales.event_id],
+        set_={'tickets_sold': EventSales.tickets_sold + stmt.excluded.tickets_sold,
+              'revenue': EventSales.revenue + stmt.excluded.revenue})
+
+
+def record(connection, deltas):
+    """Add {event_id: (tickets, revenue)} to the running totals on connection.
+
+    Call it in the transaction that writes the tickets, so the totals commit
+    or roll back with them. Negative deltas take sales off again.
+    """
+    rows = [{'event_id': event_id, 'tickets_sold': tickets, 'revenue': revenue}
+            for event_id, (tickets, revenue) in sorted(deltas.items()) if tickets or revenue]
+    if not rows:
+        return
+    stmt = _upsert(connection.dialect.name)
+    if stmt is not None:
+        connection.execute(stmt, rows)
+        return
+    for row in rows:
+        result = connection.execute(
+            update(EventSales).where(EventSales.event_id == row['event_id'])
+            .values(tickets_sold=EventSales.tickets_sold + row['tickets_sold'],
+                    revenue=EventSales.revenue + row['revenue']))
+        if result.rowcount == 0:
+            connection.execute(insert(EventSales).values(**row))
+
+
+def record_tickets(connection, tickets):
+    """record() the sale of (event_id, quantity, price) rows."""
+    deltas = {}
+    for event_id, quantity, price in tickets:
+        sold, revenue = deltas.get(event_id, (0, 0))
+        deltas[event_id] = (sold + quantity, revenue + quantity * price)
+    record(connection, deltas)
+
+
+def _add(deltas, event_id, quantity, price, sign):
+    if event_id is None or quantity is None or price is None:
+        return
+    sold, revenue = deltas.get(event_id, (0, 0))
+    deltas[event_id] = (sold + sign * quantity, revenue + sign * quantity * price)
+
+
+def _old(state, name):
+    history = state.attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(state.obj(), name)
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_flushed_tickets(session, flush_context):
+    # Tickets written through the ORM; Core inserts call record() themselves.
+    deltas = {}
+    for ticket in session.new:
+        if isinstance(ticket, Ticket):
+            _add(deltas, ticket.event_id, ticket.quantity, ticket.price, 1)
+    for ticket in session.deleted:
+        if isinstance(ticket, Ticket):
+            state = inspect(ticket)
+            _add(deltas, _old(state, 'event_id'), _old(state, 'quantity'), _old(state, 'price'), -1)
+    for ticket in session.dirty:
+        if isinstance(ticket, Ticket) and session.is_modified(ticket):
+            state = inspect(ticket)
+            _add(deltas, _old(state, 'event_id'), _old(state, 'quantity'), _old(state, 'price'), -1)
+            _add(deltas, ticket.event_id, ticket.quantity, ticket.price, 1)
+    # an event deleted in the same flush takes its totals row with it
+    for obj in session.deleted:
+        if isinstance(obj, Event):
+            deltas.pop(obj.id, None)
+    if deltas:
+        record(session.connection(), deltas)
+
+
+def rebuild():
+    """Recompute every event's totals from the ticket table. Returns the row count."""
+    totals = (select(Ticket.event_id, func.sum(Ticket.quantity), func.sum(Ticket.quantity * Ticket.price))
+              .where(Ticket.event_id.in_(select(Event.id)))
+              .group_by(Ticket.event_id))
+    db.session.execute(delete(EventSales))
+    result = db.session.execute(
+        insert(EventSales).from_select(['event_id', 'tickets_sold', 'revenue'], totals))
+    return result.rowcount
+
+
+def _event_rows():
+    sold = func.coalesce(EventSales.tickets_sold, 0)
+    capacity = func.coalesce(Venue.capacity, 0)
+    return (select(Event.id, Event.name, Event.venue_id, Event.start_time,
+                   sold.label('tickets_sold'),
+                   func.coalesce(EventSales.revenue, 0).label('revenue'),
+                   # events nobody has bought or held seats for yet have no counter
+                   func.coalesce(SeatInventory.remaining, capacity - sold).label('remaining'))
+            .select_from(Event)
+            .outerjoin(EventSales, EventSales.event_id == Event.id)
+            .outerjoin(SeatInventory, SeatInventory.event_id == Event.id)
+            .outerjoin(Venue, Venue.id == Event.venue_id))
+
+
+def event_report():
+    """Sales and seats left per event, read from the totals rather than the tickets."""
+    return db.session.execute(_event_rows().order_by(Event.start_time, Event.id)).all()
+
+
+def venue_report():
+    """event_report() rolled up per venue."""
+    events = _event_rows().subquery()
+    return db.session.execute(
+        select(Venue.id, Venue.name,
+               func.count(events.c.id).label('events'),
+               func.coalesce(func.sum(events.c.tickets_sold), 0).label('tickets_sold'),
+               func.coalesce(func.sum(events.c.revenue), 0).label('revenue'),
+               func.coalesce(func.sum(events.c.remaining), 0).label('remaining'))
+        .select_from(Venue)
+        .outerjoin(events, events.c.venue_id == Venue.id)
+        .group_by(Venue.id, Venue.name)
+        .order_by(Venue.id)).all()
+
+
+@click.command('sales-rebuild')
+@with_appcontext
+def sales_rebuild_command():
+    """Recompute the sales totals from the tickets sold."""
+    count = rebuild()
+    db.session.commit()
+    print('Rebuilt sales totals for %d events.' % count)
+
+
+COMMANDS = (sales_rebuild_command,)
@@ -0,0 +1,130 @@
+import click
+from datetime import datetime, timedelta
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from flaskshow import db
+from flaskshow.models import Event
+
+# Columns the calendar and upcoming listings return.
+COLUMNS = (Event.id, Event.name, Event.start_time, Event.end_time, Event.venue_id, Event.ticket_price)
+
+
+class Clash(Exception):
+    """The booking overlaps event, a row of COLUMNS."""
+
+    def __init__(self, event):
+        super().__init__(event)
+        self.event = event
+
+
+def _at_venue(venue_id, exclude):
+    query = select(*COLUMNS).where(Event.venue_id == venue_id)
+    if exclude is not None:
+        query = query.where(Event.id != exclude)
+    return query
+
+
+def _running_at(venue_id, moment, exclude=None):
+    """The last event at the venue starting before moment, if it is still on then."""
+    row = db.session.execute(
+        _at_venue(venue_id, exclude).where(Event.start_time < moment)
+        .order_by(Event.start_time.desc()).limit(1)).first()
+    return row if row is not None and row.end_time > moment else None
+
+
+def find_clash(venue_id, start, end, exclude=None):
+    """An event at the venue overlapping [start, end), or None.
+
+    Bookings at a venue never overlap each other, so only two events can
+    clash with a new one: the last to start before it (if it runs past
+    start) and the first to start inside it. Both are single seeks on
+    ix_event_venue_schedule, whatever the number of events at the venue.
+    """
+    running = _running_at(venue_id, start, exclude)
+    if running is not None:
+        return running
+    return db.session.execute(
+        _at_venue(venue_id, exclude).where(Event.start_time >= start, Event.start_time < end)
+        .order_by(Event.start_time).limit(1)).first()
+
+
+def check_interval(start, end):
+    if end <= start:
+        raise ValueError('The show must end after it starts.')
+
+
+def check(venue_id, start, end, exclude=None):
+    """Raise ValueError for an empty interval, Clash for an overlapping one.
+
+    Run it in inventory.write_transaction() together with the write, so a
+    concurrent booking cannot slip in between the check and the insert.
+    """
+    check_interval(start, end)
+    if venue_id is None:
+        return
+    clash = find_clash(venue_id, start, end, exclude)
+    if clash is not None:
+        raise Clash(clash)
+
+
+def calendar(venue_id, start, end):
+    """Events at the venue that overlap [start, end), in start order."""
+    running = _running_at(venue_id, start)
+    rows = db.session.execute(
+        _at_venue(venue_id, None).where(Event.start_time >= start, Event.start_time < end)
+        .order_by(Event.start_time, Event.id)).all()
+    return ([running] if running is not None else []) + rows
+
+
+def booked(venue_ids, start, end):
+    """Events at any of the venues that overlap [start, end), by venue and start.
+
+    One statement for a batch of bookings; check() is two per booking.
+    """
+    return db.session.execute(
+        select(*COLUMNS).where(Event.venue_id.in_(venue_ids), Event.start_time < end, Event.end_time > start)
+        .order_by(Event.venue_id, Event.start_time, Event.id)).all()
+
+
+def upcoming(limit, venue_id=None, after=None):
+    """The next limit events to start after `after` (default now), everywhere or at one venue."""
+    query = select(*COLUMNS).where(Event.start_time >= (after or datetime.now()))
+    if venue_id is not None:
+        query = query.where(Event.venue_id == venue_id)
+    return db.session.execute(query.order_by(Event.start_time, Event.id).limit(limit)).all()
+
+
+def this_week():
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today, today + timedelta(days=7)
+
+
+def clashes():
+    """Yield (earlier, later) pairs of overlapping events already in the database."""
+    rows = db.session.execute(
+        select(Event.venue_id, Event.id, Event.name, Event.start_time, Event.end_time)
+        .where(Event.venue_id.is_not(None))
+        .order_by(Event.venue_id, Event.start_time, Event.id)
+        .execution_options(yield_per=1000))
+    latest = None  # the event at this venue that ends last so far
+    for row in rows:
+        if latest is not None and latest.venue_id == row.venue_id and latest.end_time > row.start_time:
+            yield latest, row
+        if latest is None or latest.venue_id != row.venue_id or row.end_time > latest.end_time:
+            latest = row
+
+
+@click.command('schedule-clashes')
+@with_appcontext
+def schedule_clashes_command():
+    """List overlapping bookings made before clashes were rejected."""
+    found = 0
+    for earlier, later in clashes():
+        found += 1
+        print('venue %d: #%d %s (%s - %s) overlaps #%d %s (%s - %s)' % (
+            later.venue_id, earlier.id, earlier.name, earlier.start_time, earlier.end_time,
+            later.id, later.name, later.start_time, later.end_time))
+    print('%d overlapping bookings.' % found)
+
+
+COMMANDS = (schedule_clashes_command,)
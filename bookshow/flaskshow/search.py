@@ -0,0 +1,154 @@
+import click
+import re
+from flask.cli import with_appcontext
+from sqlalchemy import DDL, event, text
+from sqlalchemy.orm import Session, joinedload
+from flaskshow import db
+from flaskshow.models import Event, Venue
+
+# One FTS5 document per venue (name + address) and per event (name). kind
+# and ref_id point back at the row and are not tokenized; the prefix
+# indexes keep "type-ahead" prefix queries as cheap as whole-word ones.
+CREATE_INDEX = ("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+                "kind UNINDEXED, ref_id UNINDEXED, name, address, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+DROP_INDEX = 'DROP TABLE IF EXISTS search_index'
+
+# Documents are keyed by rowid, so a write finds its old document by key:
+# kind and ref_id are UNINDEXED and filtering on them scans the whole table.
+KIND_CODES = {'venue': 0, 'event': 1}
+
+# bm25 column weights: kind, ref_id, name, address
+RANK = 'bm25(search_index, 0.0, 0.0, 10.0, 1.0)'
+
+REBUILD_VENUES = ("INSERT INTO search_index (rowid, kind, ref_id, name, address) "
+                  "SELECT id * 2, 'venue', id, name, address FROM venue")
+REBUILD_EVENTS = ("INSERT INTO search_index (rowid, kind, ref_id, name, address) "
+                  "SELECT id * 2 + 1, 'event', id, name, '' FROM event")
+
+event.listen(db.metadata, 'after_create', DDL(CREATE_INDEX).execute_if(dialect='sqlite'))
+event.listen(db.metadata, 'before_drop', DDL(DROP_INDEX).execute_if(dialect='sqlite'))
+
+
+def _use_fts(bind):
+    return bind.dialect.name == 'sqlite'
+
+
+def _documents(obj):
+    if isinstance(obj, Venue):
+        return 'venue', obj.name, obj.address
+    return 'event', obj.name, ''
+
+
+def _rowid(kind, ref_id):
+    return ref_id * len(KIND_CODES) + KIND_CODES[kind]
+
+
+def _delete(connection, documents):
+    """Delete the (kind, ref_id) documents."""
+    if documents:
+        connection.execute(text('DELETE FROM search_index WHERE rowid = :rowid'),
+                           [{'rowid': _rowid(kind, ref_id)} for kind, ref_id in documents])
+
+
+def _insert(connection, rows):
+    if rows:
+        connection.execute(text('INSERT INTO search_index (rowid, kind, ref_id, name, address) '
+                                'VALUES (:rowid, :kind, :ref_id, :name, :address)'),
+                           [dict(row, rowid=_rowid(row['kind'], row['ref_id'])) for row in rows])
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_index(session, flush_context):
+    """Mirror venue and event writes into search_index in the same transaction."""
+    changed = [o for o in session.new if isinstance(o, (Venue, Event))]
+    changed += [o for o in session.dirty if isinstance(o, (Venue, Event))
+                and session.is_modified(o, include_collections=False)]
+    deleted = [o for o in session.deleted if isinstance(o, (Venue, Event))]
+    if not (changed or deleted):
+        return
+    connection = session.connection()
+    if not _use_fts(connection):
+        return
+    _delete(connection, [(_documents(obj)[0], obj.id) for obj in changed + deleted])
+    rows = []
+    for obj in changed:
+        kind, name, address = _documents(obj)
+        rows.append({'kind': kind, 'ref_id': obj.id, 'name': name, 'address': address})
+    _insert(connection, rows)
+
+
+def add_documents(connection, kind, docs):
+    """Index rows inserted outside the ORM session, e.g. by a bulk import.
+
+    docs are (ref_id, name, address) tuples.
+    """
+    if _use_fts(connection):
+        _insert(connection, [{'kind': kind, 'ref_id': ref_id, 'name': name, 'address': address}
+                             for ref_id, name, address in docs])
+
+
+def rebuild():
+    """Repopulate search_index from the venue and event tables."""
+    connection = db.session.connection()
+    if not _use_fts(connection):
+        return
+    connection.execute(text('DELETE FROM search_index'))
+    connection.execute(text(REBUILD_VENUES))
+    connection.execute(text(REBUILD_EVENTS))
+    connection.execute(text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+    db.session.commit()
+
+
+def _match_expression(query):
+    # Quote every word so user input can never be read as FTS5 syntax, and
+    # match it as a prefix, which is the closest we get to the old LIKE.
+    words = re.findall(r'\w+', query or '')
+    return ' '.join('"%s"*' % word for word in words)
+
+
+def _like_hits(query, limit, offset):
+    pattern = '%{}%'.format(query)
+    venues = [('venue', v.id) for v in
+              Venue.query.with_entities(Venue.id).filter(Venue.address.like(pattern)).order_by(Venue.id)]
+    events = [('event', e.id) for e in
+              Event.query.with_entities(Event.id).filter(Event.name.like(pattern)).order_by(Event.id)]
+    return (venues + events)[offset:offset + limit]
+
+
+def search(query, page=1, per_page=20):
+    """Return (venues, events, has_next) for one page of ranked matches."""
+    page = max(page, 1)
+    offset = (page - 1) * per_page
+    if _use_fts(db.session.get_bind()):
+        match = _match_expression(query)
+        if not match:
+            return [], [], False
+        hits = db.session.execute(
+            text('SELECT kind, ref_id FROM search_index WHERE search_index MATCH :match '
+                 'ORDER BY %s LIMIT :limit OFFSET :offset' % RANK),
+            {'match': match, 'limit': per_page + 1, 'offset': offset}).all()
+    else:
+        hits = _like_hits(query, per_page + 1, offset)
+    has_next = len(hits) > per_page
+    hits = hits[:per_page]
+
+    venue_ids = [ref_id for kind, ref_id in hits if kind == 'venue']
+    event_ids = [ref_id for kind, ref_id in hits if kind == 'event']
+    venues = {v.id: v for v in Venue.query.filter(Venue.id.in_(venue_ids))} if venue_ids else {}
+    events = ({e.id: e for e in Event.query.options(joinedload(Event.venue)).filter(Event.id.in_(event_ids))}
+              if event_ids else {})
+    return ([venues[i] for i in venue_ids if i in venues],
+            [events[i] for i in event_ids if i in events],
+            has_next)
+
+
+@click.command('search-reindex')
+@with_appcontext
+def search_reindex_command():
+    """Rebuild the full-text search index."""
+    rebuild()
+    print('Search index rebuilt.')
+
+
+COMMANDS = (search_reindex_command,)
@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, g, request
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+from flaskshow import db
+from flaskshow.models import Event, TableVersion, Venue
+
+# Version rows bumped by writes to each model.
+MODEL_TABLES = {Venue: 'venue', Event: 'event'}
+
+
+def bump(connection, *names):
+    """Increment the version of each named table on the given connection."""
+    now = datetime.utcnow()
+    for name in names:
+        result = connection.execute(
+            update(TableVersion).where(TableVersion.name == name)
+            .values(version=TableVersion.version + 1, updated_at=now))
+        if result.rowcount == 0:
+            connection.execute(insert(TableVersion).values(name=name, version=1, updated_at=now))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_versions(session, flush_context):
+    # Runs inside the flush's transaction, so the version moves atomically
+    # with the rows it describes.
+    names = {MODEL_TABLES[type(obj)]
+             for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+             if type(obj) in MODEL_TABLES}
+    if names:
+        bump(session.connection(), *sorted(names))
+
+
+def versions_query(names):
+    return (select(TableVersion.name, TableVersion.version, TableVersion.updated_at)
+            .where(TableVersion.name.in_(names)))
+
+
+def validators(names, rows):
+    """(etag, last_modified) from the rows of versions_query(names)."""
+    rows = dict((row.name, row) for row in rows)
+    etag = '-'.join('%s.%d' % (name, rows[name].version if name in rows else 0) for name in names)
+    stamps = [row.updated_at for row in rows.values()]
+    last_modified = max(stamps).replace(microsecond=0, tzinfo=timezone.utc) if stamps else None
+    return etag, last_modified
+
+
+def current(*names):
+    """Return (etag, last_modified) for the named tables in one query."""
+    return validators(names, db.session.execute(versions_query(names)))
+
+
+def conditional(*names):
+    """Answer conditional GETs from the table versions alone.
+
+    The view only runs when the client's copy is stale, so a 304 costs one
+    indexed read and never loads or serializes rows.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = current(*names)
+            g.etag = etag
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = bool(since and last_modified and last_modified <= since)
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
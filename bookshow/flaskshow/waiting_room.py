@@ -0,0 +1,249 @@
+import click
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import current_app, render_template, session
+from flask.cli import with_appcontext
+from flask_login import current_user
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from flaskshow import inventory
+
+# Session keys: a place in the queue per event, then a pass once admitted.
+QUEUE_KEY = 'waiting_room'
+PASS_KEY = 'waiting_room_passes'
+
+_lock = threading.Lock()
+
+
+class QueueStore:
+    """Admission state per event, in its own SQLite file shared by every worker.
+
+    A queue is two counters: the last place handed out and the last place
+    admitted. Places are admitted in order at the event's rate, with a
+    burst allowance that lets buyers straight through while it is quiet.
+    Nothing here touches the main database, so a crowd waiting for one
+    show costs the ticket tables nothing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS queue ('
+            'event_id INTEGER PRIMARY KEY, last_place INTEGER NOT NULL, admitted INTEGER NOT NULL, '
+            'allowance REAL NOT NULL, updated REAL NOT NULL, rate REAL, sold_out_until REAL NOT NULL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _update(self, event_id, join):
+        """Admit whoever is due and optionally take the next place; returns (last place, admitted)."""
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT last_place, admitted, allowance, updated, rate FROM queue '
+                               'WHERE event_id = ?', (event_id,)).fetchone()
+            burst = current_app.config['WAITING_ROOM_BURST']
+            last_place, admitted, allowance, updated, rate = row or (0, 0, burst, now, None)
+            rate = rate or current_app.config['WAITING_ROOM_RATE']
+            if join:
+                last_place += 1
+            allowance = min(burst, allowance + (now - updated) * rate)
+            due = min(int(allowance), last_place - admitted)
+            admitted += due
+            allowance -= due
+            conn.execute('INSERT INTO queue (event_id, last_place, admitted, allowance, updated, rate, sold_out_until) '
+                         'VALUES (?, ?, ?, ?, ?, NULL, 0) ON CONFLICT (event_id) DO UPDATE SET '
+                         'last_place = excluded.last_place, admitted = excluded.admitted, '
+                         'allowance = excluded.allowance, updated = excluded.updated',
+                         (event_id, last_place, admitted, allowance, now))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return last_place, admitted
+
+    def join(self, event_id):
+        place, admitted = self._update(event_id, join=True)
+        return place, place - admitted
+
+    def position(self, event_id, place):
+        """Places still ahead of `place`; 0 once it is admitted."""
+        _, admitted = self._update(event_id, join=False)
+        return max(place - admitted, 0)
+
+    def sold_out(self, event_id):
+        row = self._connection().execute(
+            'SELECT sold_out_until FROM queue WHERE event_id = ?', (event_id,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def mark_sold_out(self, event_id, seconds):
+        self._connection().execute(
+            'INSERT INTO queue (event_id, last_place, admitted, allowance, updated, rate, sold_out_until) '
+            'VALUES (?, 0, 0, 0, ?, NULL, ?) ON CONFLICT (event_id) DO UPDATE SET '
+            'sold_out_until = excluded.sold_out_until', (event_id, time.time(), time.time() + seconds))
+
+    def set_rate(self, event_id, rate):
+        self._update(event_id, join=False)
+        self._connection().execute('UPDATE queue SET rate = ? WHERE event_id = ?', (rate, event_id))
+
+    def status(self, event_id):
+        return self._connection().execute(
+            'SELECT last_place, admitted, rate, sold_out_until FROM queue WHERE event_id = ?',
+            (event_id,)).fetchone()
+
+
+def store():
+    """The app's QueueStore, opened on first use so nothing is opened before a fork."""
+    with _lock:
+        queue_store = current_app.extensions.get('waiting_room')
+        if queue_store is None:
+            path = current_app.config['WAITING_ROOM_PATH'] or os.path.join(current_app.instance_path, 'waiting_room.db')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            queue_store = current_app.extensions['waiting_room'] = QueueStore(path)
+    return queue_store
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='flaskshow.waiting_room')
+
+
+def _signed(key, event_id, max_age):
+    """The payload of the session's token for the event, if it is valid for this visitor."""
+    token = session.get(key, {}).get(str(event_id))
+    if token is None:
+        return None
+    try:
+        payload = _serializer().loads(token, max_age=max_age)
+    except BadSignature:  # expired tokens included
+        return None
+    # tokens are bound to the signed-in account, so they cannot be handed on
+    if payload.get('e') != event_id or payload.get('u') != session.get('_user_id'):
+        return None
+    return payload
+
+
+def _keep(key, event_id, payload):
+    tokens = dict(session.get(key, {}))
+    if payload is None:
+        tokens.pop(str(event_id), None)
+    else:
+        tokens[str(event_id)] = _serializer().dumps(payload)
+    session[key] = tokens
+
+
+def admitted(event_id):
+    return _signed(PASS_KEY, event_id, current_app.config['WAITING_ROOM_ADMIT_SECONDS']) is not None
+
+
+def sold_out(event_id):
+    return store().sold_out(event_id)
+
+
+def mark_sold_out(event_id):
+    """Turn buyers away from the event without a database query for a while.
+
+    Lapsing holds can free seats again, so the mark only lasts
+    WAITING_ROOM_SOLD_OUT_SECONDS.
+    """
+    if current_app.config['WAITING_ROOM_ENABLED']:
+        store().mark_sold_out(event_id, current_app.config['WAITING_ROOM_SOLD_OUT_SECONDS'])
+
+
+def enter(event_id, join=True):
+    """The visitor's position in the event's queue; 0 means admitted.
+
+    Joins the queue if the visitor has no place yet and `join` is set,
+    otherwise returns None for them. Admission swaps the place for a pass
+    good for WAITING_ROOM_ADMIT_SECONDS.
+    """
+    if admitted(event_id):
+        return 0
+    place = _signed(QUEUE_KEY, event_id, current_app.config['WAITING_ROOM_TOKEN_MAX_AGE'])
+    if place is not None:
+        position = store().position(event_id, place['p'])
+    elif join:
+        number, position = store().join(event_id)
+        place = {'e': event_id, 'u': session.get('_user_id'), 'p': number}
+        _keep(QUEUE_KEY, event_id, place)
+    else:
+        return None
+    if position == 0:
+        _keep(QUEUE_KEY, event_id, None)
+        _keep(PASS_KEY, event_id, {'e': event_id, 'u': session.get('_user_id')})
+    return position
+
+
+def wait_seconds(event_id, position):
+    """Rough time until a visitor `position` places back is admitted."""
+    row = store().status(event_id)
+    rate = (row[2] if row and row[2] else None) or current_app.config['WAITING_ROOM_RATE']
+    return max(1, round(position / rate))
+
+
+def _holding(event_id):
+    # only asked about events marked sold out, so the crowd costs no query
+    if not current_user.is_authenticated or not current_user.is_buyer():
+        return False
+    return inventory.held_seats(event_id, current_user.id) > 0
+
+
+def gate(event_ids):
+    """({sold out event ids}, {event_id: position}) for a purchase of the given events.
+
+    Both are empty when the visitor may go ahead. A visitor with a pass,
+    or holding seats on an event marked sold out, goes ahead: their own
+    hold may be what sold it out.
+    """
+    if not current_app.config['WAITING_ROOM_ENABLED']:
+        return set(), {}
+    waiting = [event_id for event_id in event_ids if not admitted(event_id)]
+    marked = {event_id for event_id in waiting if sold_out(event_id)}
+    gone = {event_id for event_id in marked if not _holding(event_id)}
+    if gone:
+        return gone, {}
+    positions = {event_id: enter(event_id) for event_id in waiting if event_id not in marked}
+    return set(), {event_id: position for event_id, position in positions.items() if position}
+
+
+def admission_required(view):
+    """Queue visitors for the view's event_id before any of its database work."""
+    @wraps(view)
+    def wrapper(event_id, *args, **kwargs):
+        gone, waiting = gate([event_id])
+        if gone or waiting:
+            position = waiting.get(event_id, 0)
+            return render_template('waiting_room.html', event_id=event_id, sold_out=bool(gone),
+                                   position=position, wait=wait_seconds(event_id, position) if position else 0)
+        return view(event_id, *args, **kwargs)
+    return wrapper
+
+
+@click.command('waiting-room')
+@with_appcontext
+@click.argument('event_id', type=int)
+@click.option('--rate', type=float, help='buyers admitted per second; 0 goes back to WAITING_ROOM_RATE')
+def waiting_room_command(event_id, rate):
+    """Show an event's queue, or change how fast it admits buyers."""
+    if rate is not None:
+        store().set_rate(event_id, rate or None)
+    row = store().status(event_id)
+    if row is None:
+        print('No queue for event %d.' % event_id)
+        return
+    last_place, admitted, event_rate, sold_out_until = row
+    print('event %d: %d waiting, %d admitted, %s buyers/s%s' % (
+        event_id, last_place - admitted, admitted, event_rate or current_app.config['WAITING_ROOM_RATE'],
+        ', sold out' if sold_out_until > time.time() else ''))
+
+
+COMMANDS = (waiting_room_command,)
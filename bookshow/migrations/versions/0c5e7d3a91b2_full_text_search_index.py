@@ -0,0 +1,34 @@
+"""full-text search index
+
+Revision ID: 0c5e7d3a91b2
+Revises: fbee9a8307f0
+Create Date: 2026-10-18 10:41:07.318552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c5e7d3a91b2'
+down_revision = 'fbee9a8307f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+               "kind UNINDEXED, ref_id UNINDEXED, name, address, "
+               "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+    op.execute("INSERT INTO search_index (kind, ref_id, name, address) "
+               "SELECT 'venue', id, name, address FROM venue")
+    op.execute("INSERT INTO search_index (kind, ref_id, name, address) "
+               "SELECT 'event', id, name, '' FROM event")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute('DROP TABLE IF EXISTS search_index')
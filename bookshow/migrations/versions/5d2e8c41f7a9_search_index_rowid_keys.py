@@ -0,0 +1,33 @@
+"""search index keyed by rowid
+
+Revision ID: 5d2e8c41f7a9
+Revises: 6b3a489fc9c3
+Create Date: 2026-10-18 12:02:31.615204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8c41f7a9'
+down_revision = '6b3a489fc9c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    # documents are now found by rowid = id * 2 (venues) or id * 2 + 1 (events)
+    op.execute('DELETE FROM search_index')
+    op.execute("INSERT INTO search_index (rowid, kind, ref_id, name, address) "
+               "SELECT id * 2, 'venue', id, name, address FROM venue")
+    op.execute("INSERT INTO search_index (rowid, kind, ref_id, name, address) "
+               "SELECT id * 2 + 1, 'event', id, name, '' FROM event")
+    op.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+
+
+def downgrade():
+    # the rowid keys are valid for the old code as well
+    pass
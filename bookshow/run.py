@@ -1,6 +1,6 @@
-from flaskshow import app
-
+from flaskshow import create_app
 
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file